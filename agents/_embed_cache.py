@@ -0,0 +1,39 @@
+# agents/_embed_cache.py: Process-wide query-embedding cache (SHA-256 keyed LRU with TTL)
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Tuple
+
+MAX_ENTRIES = 10_000
+TTL_SECONDS = 3600
+
+# sha256(query) -> (stored_at, vector); insertion order doubles as LRU order
+_cache: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+_lock = threading.Lock()  # Embeds run in worker threads
+
+
+def _key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def cached_embed_query(text: str, embed: Callable[[str], List[float]]) -> List[float]:
+    """Return a fresh cached vector for text, else embed and store it."""
+    key = _key(text)
+    with _lock:
+        hit = _cache.get(key)
+        if hit is not None and time.monotonic() - hit[0] < TTL_SECONDS:
+            _cache.move_to_end(key)
+            return hit[1]
+    vector = embed(text)  # Outside the lock: don't serialize misses
+    with _lock:
+        _cache[key] = (time.monotonic(), vector)
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return vector
+
+
+def clear_embedding_cache() -> None:
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,73 @@
+# agents/_limits.py: Client-side throttling + 429 backoff for LLM and embedding calls
+import asyncio
+import os
+import threading
+from typing import Any, Callable, Dict
+import anthropic
+import openai
+import tenacity
+from config import MODEL_CONFIGS
+
+# In-flight request cap per process (start from tier RPM / 60)
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "8"))
+
+_OAI_SEM = asyncio.Semaphore(OPENAI_CONCURRENCY)  # Chain calls on the event loop
+_OAI_THREAD_SEM = threading.BoundedSemaphore(OPENAI_CONCURRENCY)  # Sync embed calls in worker threads
+
+# Per-provider in-flight caps for fan-outs that span providers (e.g. the validator debate)
+PROVIDER_CONCURRENCY = {
+    "openai": OPENAI_CONCURRENCY,
+    "anthropic": int(os.getenv("ANTHROPIC_CONCURRENCY", "5")),
+    "xai": int(os.getenv("XAI_CONCURRENCY", "5")),
+}
+PROVIDER_SEMAPHORES = {provider: asyncio.Semaphore(n) for provider, n in PROVIDER_CONCURRENCY.items()}
+PROVIDER_SEMAPHORES["openai"] = _OAI_SEM  # One OpenAI budget shared with limited_ainvoke & co.
+PROVIDER_OF = {cfg["agent_role"]: cfg["model_provider"] for cfg in MODEL_CONFIGS}
+
+RATE_LIMIT_ERRORS = (openai.RateLimitError, anthropic.RateLimitError)
+
+# Exponential backoff with jitter so throttled callers don't retry in lockstep
+retry_on_rate_limit = tenacity.retry(
+    wait=tenacity.wait_exponential_jitter(initial=1, max=30),
+    retry=tenacity.retry_if_exception_type(RATE_LIMIT_ERRORS),
+    stop=tenacity.stop_after_attempt(6),
+    reraise=True,
+)
+
+
+@retry_on_rate_limit
+async def limited_ainvoke(chain, inputs: Dict[str, Any]) -> Any:
+    """chain.ainvoke under the shared concurrency limit."""
+    async with _OAI_SEM:
+        return await chain.ainvoke(inputs)
+
+
+@retry_on_rate_limit
+async def limited_astream_final(chain, inputs: Dict[str, Any]) -> Any:
+    """Drain chain.astream under the limit and return the last (cumulative) chunk."""
+    async with _OAI_SEM:
+        last = None
+        async for chunk in chain.astream(inputs):
+            last = chunk or last
+        return last
+
+
+async def limited_astream(chain, inputs: Dict[str, Any]):
+    """chain.astream holding a limiter slot; not retried since chunks may already be consumed."""
+    async with _OAI_SEM:
+        async for chunk in chain.astream(inputs):
+            yield chunk
+
+
+@retry_on_rate_limit
+async def bounded_invoke(role: str, chain, inputs: Dict[str, Any]) -> Any:
+    """chain.ainvoke under the concurrency cap of the provider serving `role`."""
+    async with PROVIDER_SEMAPHORES.get(PROVIDER_OF.get(role), _OAI_SEM):
+        return await chain.ainvoke(inputs)
+
+
+@retry_on_rate_limit
+def limited_embed(fn: Callable[..., Any], *args: Any) -> Any:
+    """Blocking embed call under the thread-side limit."""
+    with _OAI_THREAD_SEM:
+        return fn(*args)
@@ -0,0 +1,70 @@
+# agents/_llm_cache.py: Persistent LangChain LLM cache (prompt + model params -> generations)
+import functools
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Optional
+from langchain_core.caches import BaseCache, InMemoryCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+from config import INDEX_DIR
+
+# LLM_CACHE: "sqlite" (persistent, default), "memory" (per-process, e.g. tests) or "off"
+LLM_CACHE = os.getenv("LLM_CACHE", "sqlite").lower()
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", str(INDEX_DIR / "llm_cache.sqlite3")))
+
+
+class SQLiteLLMCache(BaseCache):
+    """SQLite-backed BaseCache; keyed on the rendered prompt and the model's llm_string."""
+
+    def __init__(self, path: Path = LLM_CACHE_PATH):
+        self._path = Path(path)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self._path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "prompt TEXT NOT NULL, llm_string TEXT NOT NULL, generations TEXT NOT NULL, "
+            "PRIMARY KEY (prompt, llm_string))"
+        )
+        return conn
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT generations FROM llm_cache WHERE prompt = ? AND llm_string = ?",
+                (prompt, llm_string),
+            ).fetchone()
+        return loads(row[0]) if row else None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (prompt, llm_string, generations) VALUES (?, ?, ?)",
+                (prompt, llm_string, dumps(list(return_val))),
+            )
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM llm_cache")
+
+
+@functools.cache
+def _shared_cache() -> Optional[BaseCache]:
+    if LLM_CACHE == "off":
+        return None
+    return InMemoryCache() if LLM_CACHE == "memory" else SQLiteLLMCache()
+
+
+def with_llm_cache(model: Any) -> Any:
+    """Copy of `model` that reads/writes the LLM cache (identical prompts skip the model call).
+
+    Attached per model rather than via set_llm_cache, so only the chains that opt in are cached.
+    """
+    cache = _shared_cache()
+    if model is None or cache is None:
+        return model
+    return model.model_copy(update={"cache": cache})
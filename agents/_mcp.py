@@ -0,0 +1,147 @@
+# agents/_mcp.py: Persistent MCP client session shared by agent tool calls
+import asyncio
+import importlib.util
+import os
+from contextlib import AsyncExitStack
+from typing import Any, Awaitable, Callable, Dict, Optional
+import anyio
+import httpx
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+MCP_URL = "http://localhost:8000/mcp"
+
+# Below this size the tools never return a sharding hint, so agents stat locally instead
+MCP_SKIP_BELOW_MB = float(os.getenv("MCP_SKIP_BELOW_MB", "5"))
+
+# Keep-alive pool for the session's transport: calls reuse warm connections
+MCP_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=50, keepalive_expiry=60.0)
+_HTTP2 = importlib.util.find_spec("h2") is not None  # httpx[http2] extra; negotiated on TLS endpoints
+
+
+def _pooled_http_client(
+    headers: Optional[Dict[str, str]] = None,
+    timeout: Optional[httpx.Timeout] = None,
+    auth: Optional[httpx.Auth] = None,
+) -> httpx.AsyncClient:
+    """httpx client factory for streamablehttp_client (same defaults as the MCP one, plus pooling)."""
+    return httpx.AsyncClient(
+        headers={"Connection": "keep-alive", **(headers or {})},  # Explicit for proxies that default to close
+        timeout=timeout or httpx.Timeout(30.0),
+        auth=auth,
+        follow_redirects=True,
+        limits=MCP_HTTP_LIMITS,
+        http2=_HTTP2,
+    )
+
+
+# One initialized session per event loop (reused across pipeline steps)
+_mcp_session: Optional[ClientSession] = None
+_mcp_cm: Optional[asyncio.Task] = None  # Owner task holding the AsyncExitStack open
+_mcp_closed: Optional[asyncio.Event] = None
+_mcp_lock: Optional[asyncio.Lock] = None
+_mcp_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def _session_owner(ready: asyncio.Future, closed: asyncio.Event) -> None:
+    """Enter transport + session in a dedicated task so they are exited by the same task."""
+    try:
+        async with AsyncExitStack() as stack:
+            read, write, _ = await stack.enter_async_context(
+                streamablehttp_client(MCP_URL, httpx_client_factory=_pooled_http_client)
+            )
+            session = await stack.enter_async_context(ClientSession(read, write))
+            await session.initialize()
+            ready.set_result(session)
+            await closed.wait()
+    except BaseException as e:
+        if not ready.done():
+            ready.set_exception(e)
+        if not isinstance(e, Exception):
+            raise
+
+
+def _bind_loop() -> None:
+    """Drop state belonging to a previous event loop (e.g. between asyncio.run calls)."""
+    global _mcp_session, _mcp_cm, _mcp_closed, _mcp_lock, _mcp_loop
+    loop = asyncio.get_running_loop()
+    if _mcp_loop is not loop:
+        _mcp_session, _mcp_cm, _mcp_closed = None, None, None
+        _mcp_lock = asyncio.Lock()
+        _mcp_loop = loop
+
+
+async def get_mcp_session() -> ClientSession:
+    """Return the cached MCP session, connecting + initializing on first use."""
+    global _mcp_session, _mcp_cm, _mcp_closed
+    _bind_loop()
+    async with _mcp_lock:
+        if _mcp_session is None:
+            ready = asyncio.get_running_loop().create_future()
+            _mcp_closed = asyncio.Event()
+            _mcp_cm = asyncio.create_task(_session_owner(ready, _mcp_closed))
+            try:
+                _mcp_session = await ready
+            except BaseException:
+                _mcp_cm, _mcp_closed = None, None
+                raise
+        return _mcp_session
+
+
+async def close_mcp_session() -> None:
+    """Shutdown hook: close the cached session and its transport."""
+    global _mcp_session, _mcp_cm, _mcp_closed
+    if _mcp_cm is None or _mcp_loop is not asyncio.get_running_loop():
+        _mcp_session, _mcp_cm, _mcp_closed = None, None, None
+        return
+    owner, closed = _mcp_cm, _mcp_closed
+    _mcp_session, _mcp_cm, _mcp_closed = None, None, None
+    closed.set()
+    await asyncio.gather(owner, return_exceptions=True)
+
+
+# Failures meaning the session's transport is gone (worth one reconnect). Protocol and tool
+# errors propagate: the session is healthy and the call must not run twice
+_TRANSPORT_ERRORS = (
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+    httpx.TransportError,
+    ConnectionError,
+)
+
+
+async def _with_session(op: Callable[[ClientSession], Awaitable[Any]]) -> Any:
+    """Run op on the shared session, reconnecting once on transport failure."""
+    session = await get_mcp_session()
+    try:
+        return await op(session)
+    except _TRANSPORT_ERRORS:
+        # Graceful reconnection: stale/broken session -> rebuild and retry once
+        async with _mcp_lock:
+            if _mcp_session is session:
+                await close_mcp_session()
+        session = await get_mcp_session()
+        return await op(session)
+
+
+async def call_mcp_tool(name: str, arguments: Dict[str, Any]) -> Any:
+    """Call an MCP tool on the shared session."""
+    return await _with_session(lambda session: session.call_tool(name, arguments))
+
+
+async def list_mcp_tools() -> Dict[str, str]:
+    """Tool name -> description from the shared session."""
+    tools_resp = await _with_session(lambda session: session.list_tools())
+    return {tool.name: tool.description for tool in tools_resp.tools}
+
+
+def local_metadata(file_path: str, sharding_hint: str) -> Optional[Dict[str, Any]]:
+    """structuredContent stub for small local files; None when the MCP tool should run."""
+    try:
+        size_mb = os.path.getsize(file_path) / (1024 * 1024)
+    except OSError:
+        return None  # Not readable here: let the MCP server resolve it
+    if size_mb >= MCP_SKIP_BELOW_MB:
+        return None
+    return {"metadata": {"size_mb": size_mb, "sharding_hint": sharding_hint}}
@@ -0,0 +1,19 @@
+# agents/_parsing.py: Output parsers for agent chains
+from typing import List, Optional
+import pydantic
+from langchain_core.outputs import Generation
+from langchain_core.output_parsers import PydanticOutputParser
+
+
+class FastPydanticOutputParser(PydanticOutputParser):
+    """PydanticOutputParser that validates raw JSON text in one pydantic-core pass.
+
+    Prompts demand bare JSON, so the common case skips json.loads + dict validation;
+    fenced or otherwise wrapped output falls back to the stock (markdown-tolerant) path.
+    """
+
+    def parse_result(self, result: List[Generation], *, partial: bool = False) -> Optional[pydantic.BaseModel]:
+        try:
+            return self.pydantic_object.model_validate_json(result[0].text)
+        except pydantic.ValidationError:
+            return super().parse_result(result, partial=partial)
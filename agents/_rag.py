@@ -0,0 +1,319 @@
+# agents/_rag.py: Shared RAG helpers (embeddings, FAISS store, cross-process retrieval cache)
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import faiss
+import numpy as np
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from config import INDEX_DIR
+from agents._embed_cache import cached_embed_query
+from agents._limits import limited_embed
+
+# Embedding backend for RAG queries: local MiniLM (no network RTT, 384-d) or legacy OpenAI
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "huggingface").lower()
+LOCAL_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Vector dims differ per backend, so each keeps its own persist dirs (OpenAI keeps the original paths)
+EMBEDDING_INDEX_DIR = INDEX_DIR if EMBEDDING_PROVIDER == "openai" else INDEX_DIR / "minilm"
+
+# Texts per add_texts call when building indexes: one embed_documents request + one
+# Chroma upsert per batch (sweet spot for indexing throughput)
+INDEX_BATCH_SIZE = 128
+
+# Persisted retrieval results, stored alongside the vector indexes
+RETRIEVAL_CACHE_PATH = EMBEDDING_INDEX_DIR / "retrieval_cache.sqlite3"
+
+# On-disk KV cache for the OpenAI embeddings behind the Chroma-backed agents
+EMBEDDING_CACHE_DIR = INDEX_DIR / "embedding_cache"
+
+
+def build_embeddings() -> Embeddings:
+    """Construct the configured embedding model."""
+    if EMBEDDING_PROVIDER == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
+
+    import torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model_name=LOCAL_EMBEDDING_MODEL,
+        model_kwargs={"device": "cuda" if torch.cuda.is_available() else "cpu"},
+        encode_kwargs={"batch_size": 64},
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_cached_openai_embeddings() -> Embeddings:
+    """OpenAIEmbeddings behind one shared on-disk cache (documents and queries, SHA-256 keyed)."""
+    from langchain_openai import OpenAIEmbeddings
+
+    underlying = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying,
+        LocalFileStore(str(EMBEDDING_CACHE_DIR)),
+        namespace=underlying.model,  # Vectors differ per model
+        query_embedding_cache=True,
+        key_encoder="sha256",
+    )
+
+
+class LazyEmbeddings(Embeddings):
+    """Defers model load / client setup to the first embed call (keeps it off the import path)."""
+
+    def __init__(self):
+        self._embeddings: Optional[Embeddings] = None
+        self._lock = threading.Lock()
+
+    def _get(self) -> Embeddings:
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = build_embeddings()
+        return self._embeddings
+
+    # Throttled + retried on 429 (matters for the OpenAI backend)
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return limited_embed(self._get().embed_documents, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        # Repeat queries (same dataset basename across runs/agents) skip the model entirely
+        return cached_embed_query(text, lambda t: limited_embed(self._get().embed_query, t))
+
+
+class FaissVectorStore(VectorStore):
+    """Exact inner-product FAISS index (cosine on normalized vectors) for small rule/schema sets.
+
+    FAISS only holds vectors, so page contents live in a parallel SQLite table keyed by the
+    FAISS row id. Both load without unpickling, unlike Chroma's persisted HNSW.
+    """
+
+    def __init__(self, persist_directory: str, embedding_function: Embeddings):
+        self._dir = Path(persist_directory)
+        self._embedding = embedding_function
+        self._index_path = self._dir / "index.faiss"
+        self._docs_path = self._dir / "docs.sqlite3"
+        self._lock = threading.Lock()
+        self._index = faiss.read_index(str(self._index_path)) if self._index_path.exists() else None
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def _connect_docs(self) -> sqlite3.Connection:
+        self._dir.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self._docs_path)
+        conn.execute("CREATE TABLE IF NOT EXISTS docs (id INTEGER PRIMARY KEY, text TEXT NOT NULL)")
+        return conn
+
+    @staticmethod
+    def _normalized(vectors: List[List[float]]) -> np.ndarray:
+        arr = np.asarray(vectors, dtype=np.float32)
+        faiss.normalize_L2(arr)
+        return arr
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        embeddings = kwargs.get("embeddings")  # Precomputed (e.g. batched across indexes)
+        vectors = self._normalized(embeddings if embeddings is not None else self._embedding.embed_documents(texts))
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(vectors.shape[1])
+            start = self._index.ntotal
+            self._index.add(vectors)
+            ids = list(range(start, start + len(texts)))
+            with closing(self._connect_docs()) as conn, conn:
+                conn.executemany("INSERT OR REPLACE INTO docs (id, text) VALUES (?, ?)", zip(ids, texts))
+            faiss.write_index(self._index, str(self._index_path))
+        return [str(i) for i in ids]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        if self._index is None or self._index.ntotal == 0:
+            return []
+        vector = self._normalized([self._embedding.embed_query(query)])
+        with self._lock:
+            _, idx = self._index.search(vector, min(k, self._index.ntotal))
+        ids = [int(i) for i in idx[0] if i >= 0]
+        with closing(self._connect_docs()) as conn:
+            rows = dict(conn.execute(f"SELECT id, text FROM docs WHERE id IN ({','.join('?' * len(ids))})", ids))
+        return [Document(page_content=rows[i]) for i in ids if i in rows]
+
+    def stored_texts(self) -> List[str]:
+        """Every indexed page content (for content-hash dedup; FAISS ids are positional)."""
+        if not self._docs_path.exists():
+            return []
+        with closing(self._connect_docs()) as conn:
+            return [text for (text,) in conn.execute("SELECT text FROM docs")]
+
+    def __len__(self) -> int:
+        return 0 if self._index is None else self._index.ntotal
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, **kwargs: Any) -> "FaissVectorStore":
+        store = cls(persist_directory=kwargs["persist_directory"], embedding_function=embedding)
+        store.add_texts(texts)
+        return store
+
+
+def _doc_id(doc: str) -> str:
+    return hashlib.sha256(doc.encode("utf-8")).hexdigest()
+
+
+def _build_sentinel(docs: List[str], persist_directory: str) -> Path:
+    digest = hashlib.sha256(json.dumps(docs).encode("utf-8")).hexdigest()
+    return Path(persist_directory) / ".rag_cache" / f"{digest}.ok"
+
+
+def index_is_current(vectorstore: VectorStore, docs: Sequence[str], persist_directory: str) -> bool:
+    """True when this exact doc list was already built into the (non-empty) store."""
+    if not _build_sentinel(list(docs), persist_directory).exists():
+        return False
+    # Chroma exposes its row count via the collection; FaissVectorStore via len()
+    count = vectorstore._collection.count() if hasattr(vectorstore, "_collection") else len(vectorstore)
+    return count > 0
+
+
+def add_texts_once(
+    vectorstore: VectorStore,
+    docs: Sequence[str],
+    persist_directory: str,
+    vectors: Optional[List[List[float]]] = None,
+) -> bool:
+    """Batch-index docs unless this exact list was already built into the store.
+
+    A content-hash sentinel under persist_directory marks a finished build, so restarts with
+    unchanged seed docs skip the embedding calls (and stop appending duplicate rows).
+    Precomputed vectors (FaissVectorStore only) skip the embed step. Returns False when skipped.
+    """
+    docs = list(docs)
+    if index_is_current(vectorstore, docs, persist_directory):
+        return False
+    sentinel = _build_sentinel(docs, persist_directory)
+    ids = [_doc_id(doc) for doc in docs]
+    if hasattr(vectorstore, "_collection"):
+        # Chroma: content-hash ids make re-adds upserts; only embed docs it doesn't hold yet
+        known = {doc.id for doc in vectorstore.get_by_ids(ids)}
+    else:
+        # FaissVectorStore assigns positional ids (ids= is ignored): match stored texts by hash,
+        # so a changed seed list appends only its new docs instead of re-adding every one
+        known = {_doc_id(text) for text in vectorstore.stored_texts()}
+    keep = [i for i, doc_id in enumerate(ids) if doc_id not in known]
+    docs, ids = [docs[i] for i in keep], [ids[i] for i in keep]
+    if vectors is not None:
+        vectorstore.add_texts(docs, embeddings=[vectors[i] for i in keep])
+    else:
+        for i in range(0, len(docs), INDEX_BATCH_SIZE):
+            # One batched embedding call per chunk; persisted to persist_directory
+            vectorstore.add_texts(docs[i : i + INDEX_BATCH_SIZE], ids=ids[i : i + INDEX_BATCH_SIZE])
+    sentinel.parent.mkdir(parents=True, exist_ok=True)
+    sentinel.touch()
+    return True
+
+
+# One embedder shared by every agent index (model loaded once per process)
+_shared_embeddings = LazyEmbeddings()
+
+
+@functools.lru_cache(maxsize=None)
+def get_vectorstore(name: str) -> FaissVectorStore:
+    """Memoized vector store for a named index under EMBEDDING_INDEX_DIR."""
+    return FaissVectorStore(
+        persist_directory=str(EMBEDDING_INDEX_DIR / name), embedding_function=_shared_embeddings
+    )
+
+
+def embed_stale_seed_docs(seeds: Dict[str, Sequence[str]]) -> Dict[str, List[List[float]]]:
+    """Vectors for every named shared-embedder index whose seed docs aren't built yet.
+
+    All stale docs go out in one embed_documents call (one request on the OpenAI backend)
+    and are split back per index; up-to-date indexes are left out of the result.
+    """
+    stale = {
+        name: list(docs)
+        for name, docs in seeds.items()
+        if not index_is_current(get_vectorstore(name), docs, str(EMBEDDING_INDEX_DIR / name))
+    }
+    if not stale:
+        return {}
+    vectors = iter(_shared_embeddings.embed_documents([doc for docs in stale.values() for doc in docs]))
+    return {name: list(islice(vectors, len(docs))) for name, docs in stale.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def get_retriever(name: str, k: int):
+    """Memoized top-k retriever over a named index."""
+    return get_vectorstore(name).as_retriever(search_kwargs={"k": k})
+
+
+def prewarm(name: str) -> Optional[threading.Thread]:
+    """Load the embedder and a named index in a daemon thread, off the first request's path."""
+    if os.getenv("RAG_PREWARM", "1") == "0":
+        return None
+
+    def _warm() -> None:
+        try:
+            get_vectorstore(name)
+            if EMBEDDING_PROVIDER == "openai":
+                _shared_embeddings._get()  # Client only; don't spend an API call on warmup
+            else:
+                _shared_embeddings.embed_query("warmup")  # Model load + first forward pass
+        except Exception:
+            pass  # Best effort: the first real query builds it inline
+
+    thread = threading.Thread(target=_warm, name=f"rag-prewarm-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+def _connect() -> sqlite3.Connection:
+    EMBEDDING_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(RETRIEVAL_CACHE_PATH)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS retrieval_cache ("
+        "index_name TEXT NOT NULL, query_hash TEXT NOT NULL, docs TEXT NOT NULL, "
+        "PRIMARY KEY (index_name, query_hash))"
+    )
+    return conn
+
+
+def _query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+def load_cached_retrieval(index_name: str, query: str) -> Optional[Tuple[str, ...]]:
+    """Return persisted page contents for (index, query), or None on miss."""
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT docs FROM retrieval_cache WHERE index_name = ? AND query_hash = ?",
+            (index_name, _query_hash(query)),
+        ).fetchone()
+    return tuple(json.loads(row[0])) if row else None
+
+
+def store_cached_retrieval(index_name: str, query: str, docs: Sequence[str]) -> None:
+    """Persist page contents for (index, query)."""
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO retrieval_cache (index_name, query_hash, docs) VALUES (?, ?, ?)",
+            (index_name, _query_hash(query), json.dumps(list(docs))),
+        )
+
+
+def clear_cached_retrieval(index_name: str) -> None:
+    """Invalidate persisted results for an index (call after the index changes)."""
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM retrieval_cache WHERE index_name = ?", (index_name,))
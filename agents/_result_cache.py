@@ -0,0 +1,36 @@
+# agents/_result_cache.py: In-memory exact-key LRU cache for chain results
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "512"))
+
+
+def result_key(*parts: Any) -> str:
+    """SHA-256 over the verbatim parts (e.g. model role, task, full steps JSON)."""
+    return hashlib.sha256("\x1f".join(map(str, parts)).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Returns the stored result for a key seen before, else computes and stores it (LRU-bounded).
+
+    Accessed from the event loop only, so no lock is needed.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()  # Insertion order doubles as LRU order
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        value = await compute()
+        self._entries[key] = value
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
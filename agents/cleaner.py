@@ -1,23 +1,50 @@
 import asyncio
+import functools
 import os
+from typing import AsyncIterator, Optional
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from config import MODELS, PipelineStep, DATA_DIR, INDEX_DIR
-from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
-
-# Chroma for RAG: Retrieve cleaning rules (e.g., domain-specific policies)
-embeddings = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
-vectorstore = Chroma(
-    persist_directory=str(INDEX_DIR / "cleaning_rules"), embedding_function=embeddings
+from langchain_core.output_parsers import JsonOutputParser
+from config import MODELS, PipelineStep
+from agents._parsing import FastPydanticOutputParser
+from agents._mcp import call_mcp_tool, local_metadata
+from agents._limits import limited_astream, limited_astream_final
+from agents._rag import (
+    EMBEDDING_INDEX_DIR,
+    add_texts_once,
+    get_retriever,
+    get_vectorstore,
+    prewarm,
+    load_cached_retrieval,
+    store_cached_retrieval,
+    clear_cached_retrieval,
 )
-retriever = vectorstore.as_retriever(
-    search_kwargs={"k": 3}
-)  # Top 3 rules for efficiency
 
-parser = PydanticOutputParser(pydantic_object=PipelineStep)
+# FAISS for RAG: Retrieve cleaning rules (e.g., domain-specific policies).
+# Accessors, not module globals: nothing is opened until first use (tests patch these)
+def _vectorstore():
+    return get_vectorstore("cleaning_rules")  # Shared, memoized across agents
+
+
+def _retriever():
+    return get_retriever("cleaning_rules", 3)  # Top 3 rules for efficiency
+
+
+prewarm("cleaning_rules")  # Embedder/index load overlaps startup instead of the first request
+
+
+@functools.lru_cache(maxsize=512)
+def _retrieve_sync(query: str) -> tuple[str, ...]:
+    """Retrieve page contents for a query; deterministic per file, so cache in-process and on disk."""
+    cached = load_cached_retrieval("cleaning_rules", query)
+    if cached is not None:
+        return cached
+    docs = tuple(doc.page_content for doc in _retriever().invoke(query))
+    store_cached_retrieval("cleaning_rules", query, docs)
+    return docs
+
+
+parser = FastPydanticOutputParser(pydantic_object=PipelineStep)
+_FORMAT_INSTRUCTIONS = parser.get_format_instructions()  # Immutable per schema; computed once
 
 clean_template = """
 Clean dataset from {dataset_path} (current format: {current_format}). 
@@ -33,7 +60,7 @@ Rationale: Include quality fixes and scalability notes.
 IMPORTANT: Read from the PREVIOUS step's output file, not the original dataset.
 Your code must save the cleaned data to an output file.
 Include the output file path in output_file_path field and format in output_format field.
-If previous step used Spark/Parquet, continue with that format for consistency.
+Save as Parquet by default; if previous step used Spark/Parquet, continue with that format for consistency.
 
 If feedback context is provided, adapt your cleaning approach to address the identified gaps.
 
@@ -44,27 +71,66 @@ CRITICAL: Return ONLY valid JSON without any additional text, explanations, mark
 
 prompt = ChatPromptTemplate.from_template(clean_template)
 
-chain = prompt | MODELS["cleaner"] | parser
+@functools.cache
+def _chain():
+    """Cleaner chain, built (with its model) on first use.
+
+    Streamed: JsonOutputParser emits cumulative partial dicts as tokens arrive (validated at the end).
+    """
+    return prompt | MODELS["cleaner"] | JsonOutputParser(pydantic_object=PipelineStep)
+
+
+# Fallback step code: whole-column NumPy masks (no row-wise apply), columnar output
+_FALLBACK_CLEAN_SNIPPET = """import numpy as np
+import pandas as pd
+
+df = {reader}
+# Null filter (same rows as dropna) + |z| > 3 outlier mask over numeric columns
+mask = df.notna().all(axis=1).to_numpy()
+numeric = df.select_dtypes(include='number').to_numpy(dtype='float64')
+if numeric.size:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.abs((numeric - np.nanmean(numeric, axis=0)) / np.nanstd(numeric, axis=0))
+    mask &= ~(z > 3).any(axis=1)
+df_cleaned = df[mask]
+# Dictionary-encode low-cardinality strings; length-prefixed encoding for the rest
+strings = df_cleaned.select_dtypes(include=['object', 'string']).columns
+low_card = [c for c in strings if df_cleaned[c].nunique() <= 0.5 * len(df_cleaned)]
+df_cleaned.to_parquet(
+    'data/cleaned_sales_data.parquet',
+    engine='pyarrow',
+    compression='snappy',
+    index=False,
+    row_group_size=64 * 1024,
+    use_dictionary=low_card,
+    column_encoding={{c: 'DELTA_LENGTH_BYTE_ARRAY' for c in strings if c not in low_card}},
+)
+"""
 
 
-async def clean_data(dataset_path: str, ingest_step: PipelineStep, feedback_context: str = "", current_format: str = "csv") -> PipelineStep:
+async def _clean_inputs(dataset_path: str, ingest_step: PipelineStep, feedback_context: str, current_format: str) -> dict:
+    """Gather RAG rules + MCP cleaning metadata into the prompt inputs."""
     # RAG: Fetch cleaning rules (e.g., "impute nulls with median for numeric columns")
+    # MCP tool call: Use clean_data tool for standardized cleaning (persistent session, scalable to cloud)
+    # Both are independent I/O, so overlap them; retrieval runs off-loop in a thread
+    # Small local files skip the MCP round trip (stat-based metadata stub instead)
     query = f"Cleaning rules for {os.path.basename(dataset_path)}"
-    retrieved_docs = retriever.invoke(query)
-    cleaning_rules = "\n".join([doc.page_content for doc in retrieved_docs])
-
-    # MCP tool call: Use clean_data tool for standardized cleaning (scalable to cloud)
-    async with streamablehttp_client("http://localhost:8000/mcp") as (read, write, _):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            mcp_result = await session.call_tool(
+    structured_clean = local_metadata(dataset_path, "Small dataset; single-pass cleaning.")
+    if structured_clean is not None:
+        retrieved_docs = await asyncio.to_thread(_retrieve_sync, query)
+    else:
+        retrieved_docs, mcp_result = await asyncio.gather(
+            asyncio.to_thread(_retrieve_sync, query),
+            call_mcp_tool(
                 "clean_data",
                 {
                     "file_path": dataset_path,
                     "ingest_metadata": ingest_step.model_dump(),
                 },
-            )
-            structured_clean = mcp_result.structuredContent  # Pydantic-validated
+            ),
+        )
+        structured_clean = mcp_result.structuredContent  # Pydantic-validated
+    cleaning_rules = "\n".join(retrieved_docs)
 
     # Adaptive cleaning: Check size, hint parallelism (swarmlet for large data)
     if structured_clean and isinstance(structured_clean, dict) and "metadata" in structured_clean and structured_clean["metadata"]:
@@ -79,34 +145,59 @@ async def clean_data(dataset_path: str, ingest_step: PipelineStep, feedback_cont
     # Get previous step output info for continuity
     previous_output_info = f"Previous output: {ingest_step.output_file_path} (format: {ingest_step.output_format})" if ingest_step.output_file_path else "No previous output file specified"
     
-    # Async invoke for scalability (e.g., parallel cleaning in distributed ETL)
     feedback_prompt = f"\nFeedback Context: {feedback_context}" if feedback_context else ""
+    return {
+        "dataset_path": dataset_path,
+        "current_format": current_format,
+        "previous_output_info": previous_output_info,
+        "ingest_metadata": str(structured_clean.get("metadata", {})) if structured_clean else "No metadata available",
+        "cleaning_rules": cleaning_rules + "\n" + rationale_add,
+        "feedback_context": feedback_prompt,
+        "format_instructions": _FORMAT_INSTRUCTIONS,
+    }
+
+
+async def clean_data_stream(dataset_path: str, ingest_step: PipelineStep, feedback_context: str = "", current_format: str = "csv") -> AsyncIterator[dict]:
+    """Yield partial PipelineStep fields as the model streams them.
+
+    Lets the next agent prefetch as soon as e.g. output_file_path is known; the last
+    dict holds every field the model emitted.
+    """
+    inputs = await _clean_inputs(dataset_path, ingest_step, feedback_context, current_format)
+    async for partial in limited_astream(_chain(), inputs):
+        if partial:
+            yield partial
+
+
+async def clean_data(dataset_path: str, ingest_step: PipelineStep, feedback_context: str = "", current_format: str = "csv") -> PipelineStep:
+    inputs = await _clean_inputs(dataset_path, ingest_step, feedback_context, current_format)
+    # Stream the completion (async for scalability, e.g. parallel cleaning in distributed ETL)
     try:
-        result = await chain.ainvoke(
-            {
-                "dataset_path": dataset_path,
-                "current_format": current_format,
-                "previous_output_info": previous_output_info,
-                "ingest_metadata": str(structured_clean.get("metadata", {})) if structured_clean else "No metadata available",
-                "cleaning_rules": cleaning_rules + "\n" + rationale_add,
-                "feedback_context": feedback_prompt,
-                "format_instructions": parser.get_format_instructions(),
-            }
-        )
-        return result
+        # Cumulative chunks: the last one is the full object (throttled, retried on 429)
+        fields = await limited_astream_final(_chain(), inputs)
+        return PipelineStep.model_validate(fields or {})
     except Exception as e:
         print(f"⚠️ Cleaner parsing error: {e}")
         # Return fallback cleaning step to keep system running
         input_path = ingest_step.output_file_path if ingest_step.output_file_path else dataset_path
+        if ingest_step.output_format == "parquet":
+            reader = f"pd.read_parquet('{input_path}')"
+        else:
+            reader = f"pd.read_csv('{input_path}', engine='pyarrow')"  # Multi-threaded parse
         return PipelineStep(
             step_name="data_cleaning_fallback",
-            code_snippet=f"df = pd.read_csv('{input_path}'); df_cleaned = df.dropna(); df_cleaned.to_csv('data/cleaned_sales_data.csv', index=False)",
-            rationale=f"Cleaner failed with parsing error. Applied basic cleaning - dropna(). Original error: {str(e)[:100]}",
-            output_file_path="data/cleaned_sales_data.csv",
-            output_format="csv"
+            code_snippet=_FALLBACK_CLEAN_SNIPPET.format(reader=reader),
+            rationale=f"Cleaner failed with parsing error. Applied vectorized null filter and z-score outlier mask (Parquet output). Original error: {str(e)[:100]}",
+            output_file_path="data/cleaned_sales_data.parquet",
+            output_format="parquet"
         )
 
 
 # Pre-build index (call in main.py; scalable: Batch embed rules)
-def build_cleaning_index(docs: list[str]):
-    vectorstore.add_texts(docs)  # Embed rules; auto-persisted with persist_directory
+def build_cleaning_index(docs: list[str], vectors: Optional[list[list[float]]] = None):
+    # vectors: precomputed by embed_stale_seed_docs (batched with the other shared-embedder index)
+    if not add_texts_once(_vectorstore(), docs, str(EMBEDDING_INDEX_DIR / "cleaning_rules"), vectors):
+        return  # Same seed docs already indexed
+    # Index changed: drop cached retrievals
+    _retrieve_sync.cache_clear()
+    clear_cached_retrieval("cleaning_rules")
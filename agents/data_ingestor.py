@@ -1,24 +1,44 @@
 # agents/data_ingestor.py
+import functools
 import os
+from typing import AsyncIterator, Optional
 import asyncio
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from config import MODELS, PipelineStep, DATA_DIR, INDEX_DIR
-from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client  # For MCP tool integration
-
-# Setup Chroma RAG (persistent, scalable; hook for Neo4j graph extension)
-embeddings = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
-vectorstore = Chroma(
-    persist_directory=str(INDEX_DIR / "schemas"), embedding_function=embeddings
+from langchain_core.output_parsers import JsonOutputParser
+from config import MODELS, PipelineStep
+from agents._parsing import FastPydanticOutputParser
+from agents._mcp import call_mcp_tool, local_metadata  # For MCP tool integration (persistent session)
+from agents._limits import limited_astream, limited_astream_final
+from agents._rag import (
+    EMBEDDING_INDEX_DIR,
+    add_texts_once,
+    get_retriever,
+    get_vectorstore,
+    prewarm,
+    load_cached_retrieval,
+    store_cached_retrieval,
+    clear_cached_retrieval,
 )
-retriever = vectorstore.as_retriever(
-    search_kwargs={"k": 5}
-)  # Top 5 relevant for efficiency
 
-parser = PydanticOutputParser(pydantic_object=PipelineStep)
+# Setup FAISS RAG (persistent, scalable; hook for Neo4j graph extension)
+vectorstore = get_vectorstore("schemas")  # Shared, memoized across agents
+retriever = get_retriever("schemas", 5)  # Top 5 relevant for efficiency
+prewarm("schemas")  # Embedder/index load overlaps startup instead of the first request
+
+
+@functools.lru_cache(maxsize=512)
+def _retrieve_sync(query: str) -> tuple[str, ...]:
+    """Retrieve page contents for a query; deterministic per file, so cache in-process and on disk."""
+    cached = load_cached_retrieval("schemas", query)
+    if cached is not None:
+        return cached
+    docs = tuple(doc.page_content for doc in retriever.invoke(query))
+    store_cached_retrieval("schemas", query, docs)
+    return docs
+
+
+parser = FastPydanticOutputParser(pydantic_object=PipelineStep)
+_FORMAT_INSTRUCTIONS = parser.get_format_instructions()  # Immutable per schema; computed once
 
 ingest_template = """
 Ingest dataset at {dataset_path} (current format: {current_format}).
@@ -31,7 +51,7 @@ Rationale: Include quality insights and scalability notes (e.g., parallel hints)
 
 IMPORTANT: Your code must save the loaded/profiled data to an output file. 
 Include the output file path in output_file_path field and format in output_format field.
-For small datasets, save as CSV. For large datasets, consider Parquet.
+Save as Parquet by default (snappy, dictionary-encoded strings) so later steps skip re-parsing and dtype inference.
 
 If feedback context is provided, adapt your ingestion approach to address the identified gaps.
 
@@ -42,27 +62,49 @@ CRITICAL: Return ONLY valid JSON without any additional text, explanations, mark
 
 prompt = ChatPromptTemplate.from_template(ingest_template)
 
-chain = prompt | MODELS["ingestor"] | parser
+# Streamed: JsonOutputParser emits cumulative partial dicts as tokens arrive (validated at the end)
+chain = prompt | MODELS["ingestor"] | JsonOutputParser(pydantic_object=PipelineStep)
 
 
-async def ingest_data(dataset_path: str, feedback_context: str = "", current_format: str = "csv") -> PipelineStep:
+# Fallback step code: Arrow streams record batches (multi-threaded C++ parse, no GIL-bound
+# chunk loop), profiles nulls from the column buffers and writes snappy Parquet with
+# dictionary-encoded strings so later steps skip CSV re-parsing and dtype inference
+_FALLBACK_INGEST_SNIPPET = """import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+reader = pacsv.open_csv(
+    '{dataset_path}',
+    read_options=pacsv.ReadOptions(block_size=8 * 1024 * 1024, use_threads=True),
+)
+rows = nulls = 0
+with pq.ParquetWriter('data/ingested_sales_data.parquet', reader.schema, compression='snappy', use_dictionary=True) as writer:
+    for batch in reader:
+        rows += batch.num_rows
+        nulls += sum(column.null_count for column in batch.columns)
+        writer.write_batch(batch, row_group_size=64 * 1024)
+print(f'Shape: ({{rows}}, {{len(reader.schema)}})')
+print(f'Nulls: {{nulls}}')
+"""
+
+
+async def _ingest_inputs(dataset_path: str, feedback_context: str, current_format: str) -> dict:
+    """Gather RAG schema context + MCP load metadata into the prompt inputs."""
     # RAG retrieval: Embed query dynamically for schema-aware ingestion
+    # MCP tool call: Use standardized load_csv for interoperable data fetch (session reused across steps)
+    # Both are independent I/O, so overlap them; retrieval runs off-loop in a thread
+    # Small local files skip the MCP round trip (stat-based metadata stub instead)
     query = f"Schemas and ETL patterns for {os.path.basename(dataset_path)}"
-    retrieved_docs = retriever.invoke(query)
-    retrieved_context = "\n".join([doc.page_content for doc in retrieved_docs])
-
-    # MCP tool call: Use standardized load_csv for interoperable data fetch
-    async with streamablehttp_client("http://localhost:8000/mcp") as (
-        read,
-        write,
-        _,
-    ):  # Scale to cloud endpoint
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            mcp_result = await session.call_tool(
-                "load_csv", {"file_path": dataset_path}
-            )
-            structured_load = mcp_result.structuredContent  # Pydantic: Ensures contract
+    structured_load = local_metadata(dataset_path, "Small dataset; single-pass.")
+    if structured_load is not None:
+        retrieved_docs = await asyncio.to_thread(_retrieve_sync, query)
+    else:
+        retrieved_docs, mcp_result = await asyncio.gather(
+            asyncio.to_thread(_retrieve_sync, query),
+            # Only the metadata feeds the prompt: skip parsing + serializing the rows
+            call_mcp_tool("load_csv", {"file_path": dataset_path, "include_data": False}),
+        )
+        structured_load = mcp_result.structuredContent  # Pydantic: Ensures contract
+    retrieved_context = "\n".join(retrieved_docs)
 
     # Adaptive sharding: Creative swarmlet—check size, hint parallelism (extend to spawn sub-agents)
     if structured_load and isinstance(structured_load, dict) and "metadata" in structured_load and structured_load["metadata"]:
@@ -76,37 +118,56 @@ async def ingest_data(dataset_path: str, feedback_context: str = "", current_for
         rationale_add = "Small dataset; single-pass."
         metadata_str = "No metadata available"
 
-    # Invoke chain with enriched context (async for scalability in high-throughput pipelines)
     feedback_prompt = f"\nFeedback Context: {feedback_context}" if feedback_context else ""
+    return {
+        "dataset_path": dataset_path,
+        "current_format": current_format,
+        "retrieved_context": retrieved_context
+        + "\n"
+        + rationale_add
+        + "\nLoaded metadata: "
+        + metadata_str,
+        "feedback_context": feedback_prompt,
+        "format_instructions": _FORMAT_INSTRUCTIONS,
+    }
+
+
+async def ingest_data_stream(dataset_path: str, feedback_context: str = "", current_format: str = "csv") -> AsyncIterator[dict]:
+    """Yield partial PipelineStep fields as the model streams them.
+
+    Lets the next agent prefetch as soon as e.g. output_file_path is known; the last
+    dict holds every field the model emitted.
+    """
+    inputs = await _ingest_inputs(dataset_path, feedback_context, current_format)
+    async for partial in limited_astream(chain, inputs):
+        if partial:
+            yield partial
+
+
+async def ingest_data(dataset_path: str, feedback_context: str = "", current_format: str = "csv") -> PipelineStep:
+    inputs = await _ingest_inputs(dataset_path, feedback_context, current_format)
+    # Stream the completion (async for scalability in high-throughput pipelines)
     try:
-        result = await chain.ainvoke(
-            {
-                "dataset_path": dataset_path,
-                "current_format": current_format,
-                "retrieved_context": retrieved_context
-                + "\n"
-                + rationale_add
-                + "\nLoaded metadata: "
-                + metadata_str,
-                "feedback_context": feedback_prompt,
-                "format_instructions": parser.get_format_instructions(),
-            }
-        )
-        return result
+        # Cumulative chunks: the last one is the full object (throttled, retried on 429)
+        fields = await limited_astream_final(chain, inputs)
+        return PipelineStep.model_validate(fields or {})
     except Exception as e:
         print(f"⚠️ Ingestor parsing error: {e}")
         # Return fallback ingestion step to keep system running
         return PipelineStep(
             step_name="data_ingestion_fallback",
-            code_snippet="df = pd.read_csv('data/sales_data.csv'); df.to_csv('data/ingested_sales_data.csv', index=False); print(f'Shape: {df.shape}'); print(f'Nulls: {df.isnull().sum().sum()}')",
-            rationale=f"Ingestor failed with parsing error. Applied basic CSV loading and profiling. Original error: {str(e)[:100]}",
-            output_file_path="data/ingested_sales_data.csv",
-            output_format="csv"
+            code_snippet=_FALLBACK_INGEST_SNIPPET.format(dataset_path=dataset_path),
+            rationale=f"Ingestor failed with parsing error. Applied streaming Arrow CSV loading, profiling and Parquet output. Original error: {str(e)[:100]}",
+            output_file_path="data/ingested_sales_data.parquet",
+            output_format="parquet"
         )
 
 
 # Pre-build index (call in main.py; scalable: Batch embed at startup)
-def build_rag_index(docs: list[str]):
-    vectorstore.add_texts(
-        docs
-    )  # Embed; auto-persisted with persist_directory
+def build_rag_index(docs: list[str], vectors: Optional[list[list[float]]] = None):
+    # vectors: precomputed by embed_stale_seed_docs (batched with the other shared-embedder index)
+    if not add_texts_once(vectorstore, docs, str(EMBEDDING_INDEX_DIR / "schemas"), vectors):
+        return  # Same seed docs already indexed
+    # Index changed: drop cached retrievals
+    _retrieve_sync.cache_clear()
+    clear_cached_retrieval("schemas")
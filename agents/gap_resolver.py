@@ -1,17 +1,23 @@
 # agents/gap_resolver.py: Meta-swarmlet for resolving persistent gaps
 import re
 import asyncio
+import functools
+import textwrap
+from types import CodeType
 import structlog
-from typing import List, Dict
+from typing import List, Dict, Set
 from collections import Counter
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+from pydantic import BaseModel
 from config import MODELS, PipelineStep, INDEX_DIR
+from agents._parsing import FastPydanticOutputParser
+from agents._limits import limited_ainvoke
+from agents._llm_cache import with_llm_cache
+from agents._rag import get_cached_openai_embeddings
 import os
 
-parser = PydanticOutputParser(pydantic_object=PipelineStep)
+parser = FastPydanticOutputParser(pydantic_object=PipelineStep)
+_FORMAT_INSTRUCTIONS = parser.get_format_instructions()  # Immutable per schema; computed once
 
 # Specialized templates for common gap patterns
 # Enhanced gap templates with comprehensive solutions
@@ -143,6 +149,33 @@ def validate_pipeline_output(df: pd.DataFrame, rules: List[str]) -> Dict:
 """
 }
 
+# `{{`/`}}` are prompt-template escapes; raw sources are for exec and for prompt variables
+_GAP_SOURCES = {
+    name: source.replace("{{", "{").replace("}}", "}") for name, source in GAP_TEMPLATES.items()
+}
+# Templates are fixed, so compile once at import
+_COMPILED_GAPS = {
+    name: compile(textwrap.dedent(source), f"<gap:{name}>", "exec")
+    for name, source in _GAP_SOURCES.items()
+}
+
+
+def get_compiled(name: str) -> CodeType:
+    """Cached code object for a GAP_TEMPLATES entry (for executors; the source string goes to the LLM)."""
+    return _COMPILED_GAPS[name]
+
+
+# Trigger keyword -> GAP_TEMPLATES key for single_gap_fallback (extend here, not with if-chains)
+TEMPLATE_TRIGGERS = {
+    "load": "load", "storage": "load",
+    "monitoring": "monitoring", "logging": "monitoring",
+    "testing": "testing", "pytest": "testing",
+    "collaboration": "collaboration", "api": "collaboration",
+    "partitioning": "partitioning", "spark": "partitioning",
+    "validation": "validation", "quality": "validation",
+}
+_WORD_RE = re.compile(r"\w+")
+
 resolver_template = """
 You are a specialized gap resolver agent. Analyze these persistent gaps and generate concrete code solutions:
 
@@ -163,35 +196,86 @@ Ensure your code saves output to a file for the next pipeline step.
 {format_instructions}
 """
 
+# Dedicated gap resolver model; per-gap prompts repeat across runs, so identical calls are cache reads
+_model = with_llm_cache(MODELS["gap_resolver"])
+
 prompt = ChatPromptTemplate.from_template(resolver_template)
-chain = prompt | MODELS["gap_resolver"] | parser  # Use dedicated gap resolver model
+chain = prompt | _model | parser
+
+single_gap_template = """
+You are resolving the specific gap: {gap_type}
+
+Context: {context}
+Template suggestion: {template}
+
+Generate a PipelineStep that specifically addresses {gap_type} issues.
+Use the template as a starting point but adapt for the current context.
+
+{format_instructions}
+"""
+
+# Parsed + assembled once; per-gap fallback when the batched call fails
+SINGLE_GAP_CHAIN = ChatPromptTemplate.from_template(single_gap_template) | _model | parser
+
+
+class GapResolutions(BaseModel):
+    """One PipelineStep per targeted gap, returned by a single model call."""
+    steps: List[PipelineStep]
+
+
+multi_gap_parser = FastPydanticOutputParser(pydantic_object=GapResolutions)
+
+multi_gap_template = """
+You are resolving these specific gaps, each with a template suggestion:
+
+{gap_sections}
+
+Context: {context}
 
-# Setup RAG for gap similarity detection  
-embeddings = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
-gap_vectorstore = Chroma(
-    persist_directory=str(INDEX_DIR / "gap_history"), 
-    embedding_function=embeddings
-)
+Generate one PipelineStep per gap, in the order listed, that specifically addresses that gap.
+Use each template as a starting point but adapt for the current context.
+
+{format_instructions}
+"""
+
+# All top gaps in one request: one roundtrip + one system prompt instead of N
+MULTI_GAP_CHAIN = ChatPromptTemplate.from_template(multi_gap_template) | _model | multi_gap_parser
+_MULTI_GAP_FORMAT_INSTRUCTIONS = multi_gap_parser.get_format_instructions()
+
+@functools.cache
+def _get_gap_store():
+    """Gap-similarity store (cosine space: scores are cosine distances).
+
+    Built on first resolve so importing the swarm doesn't pay for Chroma + the OpenAI client.
+    """
+    from langchain_chroma import Chroma
+
+    return Chroma(
+        collection_name="gap_resolutions",
+        persist_directory=str(INDEX_DIR / "gap_history"),
+        embedding_function=get_cached_openai_embeddings(),  # Repeat texts/queries skip the API
+        collection_metadata={"hnsw:space": "cosine"},
+    )
+
+# Max cosine distance for a semantic-cache hit (~0.92 cosine similarity)
+GAP_CACHE_MAX_DISTANCE = float(os.getenv("GAP_CACHE_MAX_DISTANCE", "0.08"))
+_pending_gap_writes: Set[asyncio.Task] = set()  # Strong refs to in-flight background writes
+
+GAP_KEYWORDS = ("load", "monitoring", "testing", "collaboration", "partitioning",
+                "validation", "documentation", "error handling", "retry", "api",
+                "interface", "logging", "lineage", "scalability", "spark", "bigquery",
+                "storage", "warehouse", "s3", "cloud", "pytest", "unit test")
+# All keywords in one compiled scan; the lookahead counts every (substring) occurrence
+_GAP_KEYWORD_RE = re.compile("(?=(" + "|".join(map(re.escape, GAP_KEYWORDS)) + "))")
 
 def extract_top_gaps(rationales: List[str], top_n: int = 5) -> List[str]:
     """Extract top-N gaps using TF-IDF-like keyword frequency analysis"""
-    gap_keywords = ["load", "monitoring", "testing", "collaboration", "partitioning", 
-                   "validation", "documentation", "error handling", "retry", "api", 
-                   "interface", "logging", "lineage", "scalability", "spark", "bigquery",
-                   "storage", "warehouse", "s3", "cloud", "pytest", "unit test"]
-    
-    gap_counts = Counter()
-    
-    # Also analyze the gaps string directly
-    all_text = " ".join(rationales) + " " + " ".join([r for r in rationales if r])
+    # Analyze the combined rationale text once (lowercased once)
+    all_text = " ".join(r for r in rationales if r).lower()
     
-    for rationale in [all_text]:  # Process combined text
-        rationale_lower = rationale.lower()
-        for keyword in gap_keywords:
-            # Count both exact matches and partial matches
-            count = rationale_lower.count(keyword)
-            if count > 0:
-                gap_counts[keyword] += count
+    # Count both exact matches and partial matches, one pass for every keyword;
+    # Counter consumes the match list in C (no per-match Python increments)
+    gap_counts = Counter(_GAP_KEYWORD_RE.findall(all_text))
     
     # If no specific gaps found, return common ETL gaps
     if not gap_counts:
@@ -200,7 +284,7 @@ def extract_top_gaps(rationales: List[str], top_n: int = 5) -> List[str]:
     return [gap for gap, _ in gap_counts.most_common(top_n)]
 
 async def multi_gap_resolver_swarmlet(gaps: str, context: str, history: List[str]) -> List[PipelineStep]:
-    """Parallel processing of multiple gaps using divide-and-conquer sub-swarm"""
+    """Resolve the top gaps in one batched model call (per-gap parallel calls as fallback)"""
     
     logger = structlog.get_logger('pipeline')
     
@@ -214,28 +298,16 @@ async def multi_gap_resolver_swarmlet(gaps: str, context: str, history: List[str
                history_length=len(history))
     print(f"🎯 Multi-Gap Resolver targeting: {top_gaps}")
     
-    # Create parallel tasks for each gap
+    # Per-gap resolution (fallback path)
     async def resolve_single_gap(gap_type: str) -> PipelineStep:
         template = GAP_TEMPLATES.get(gap_type, GAP_TEMPLATES["validation"])
         
-        single_gap_template = f"""
-        You are resolving the specific gap: {gap_type}
-        
-        Context: {context}
-        Template suggestion: {template}
-        
-        Generate a PipelineStep that specifically addresses {gap_type} issues.
-        Use the template as a starting point but adapt for the current context.
-        
-        {{format_instructions}}
-        """
-        
-        prompt = ChatPromptTemplate.from_template(single_gap_template)
-        chain = prompt | MODELS["gap_resolver"] | parser
-        
         try:
-            return await chain.ainvoke({
-                "format_instructions": parser.get_format_instructions()
+            return await limited_ainvoke(SINGLE_GAP_CHAIN, {
+                "gap_type": gap_type,
+                "context": context,
+                "template": _GAP_SOURCES.get(gap_type, _GAP_SOURCES["validation"]),
+                "format_instructions": _FORMAT_INSTRUCTIONS
             })
         except Exception as e:
             print(f"⚠️ Single gap resolver failed for {gap_type}: {e}")
@@ -247,9 +319,22 @@ async def multi_gap_resolver_swarmlet(gaps: str, context: str, history: List[str
                 output_format="csv"
             )
     
-    # Execute parallel gap resolution
-    tasks = [resolve_single_gap(gap) for gap in top_gaps]
-    resolved_steps = await asyncio.gather(*tasks, return_exceptions=True)
+    # Batched resolution; on failure fall back to parallel per-gap calls
+    gap_sections = "\n\n".join(
+        f"Gap: {gap}\nTemplate suggestion:\n{_GAP_SOURCES.get(gap, _GAP_SOURCES['validation'])}"
+        for gap in top_gaps
+    )
+    try:
+        batch = await limited_ainvoke(MULTI_GAP_CHAIN, {
+            "gap_sections": gap_sections,
+            "context": context,
+            "format_instructions": _MULTI_GAP_FORMAT_INSTRUCTIONS
+        })
+        resolved_steps = batch.steps
+    except Exception as e:
+        print(f"⚠️ Batched gap resolver failed, resolving per gap: {e}")
+        tasks = [resolve_single_gap(gap) for gap in top_gaps]
+        resolved_steps = await asyncio.gather(*tasks, return_exceptions=True)
     
     # Filter out exceptions and return valid steps
     valid_steps = [step for step in resolved_steps if isinstance(step, PipelineStep)]
@@ -267,13 +352,33 @@ async def multi_gap_resolver_swarmlet(gaps: str, context: str, history: List[str
 async def resolve_persistent_gaps(gaps: str, context: str, history: List[str]) -> PipelineStep:
     """Enhanced gap resolution with multi-gap swarmlet and embedding similarity"""
     
-    # Store current gaps in RAG for future similarity detection
-    gap_vectorstore.add_texts([gaps], metadatas=[{"timestamp": str(asyncio.get_event_loop().time())}])
+    # Semantic cache: near-duplicate gaps reuse the stored resolution (skips the LLM fan-out)
+    gap_store = _get_gap_store()
+    similar_gaps = await gap_store.asimilarity_search_with_score(gaps, k=1)
+    if similar_gaps:
+        doc, distance = similar_gaps[0]
+        if distance <= GAP_CACHE_MAX_DISTANCE and "step" in doc.metadata:
+            return PipelineStep.model_validate_json(doc.metadata["step"])
     
-    # Check similarity with past gaps using embeddings
-    similar_gaps = gap_vectorstore.similarity_search(gaps, k=3)
-    similarity_context = "\n".join([doc.page_content for doc in similar_gaps])
+    resolved = await _resolve_gaps(gaps, context, history)
     
+    # Store current gaps + resolution for future similarity hits; the embed + write runs
+    # in the background so the caller isn't blocked on it
+    write = asyncio.create_task(
+        gap_store.aadd_texts(
+            [gaps],
+            metadatas=[{"timestamp": str(asyncio.get_event_loop().time()), "step": resolved.model_dump_json()}],
+        )
+    )
+    _pending_gap_writes.add(write)
+    write.add_done_callback(_pending_gap_writes.discard)
+    return resolved
+
+async def flush_gap_writes() -> None:
+    """Shutdown hook: wait for background gap-store writes to land."""
+    await asyncio.gather(*_pending_gap_writes, return_exceptions=True)
+
+async def _resolve_gaps(gaps: str, context: str, history: List[str]) -> PipelineStep:
     # Use multi-gap resolver for comprehensive solution
     try:
         multi_solutions = await multi_gap_resolver_swarmlet(gaps, context, history)
@@ -309,21 +414,12 @@ async def single_gap_fallback(gaps: str, context: str, history: List[str]) -> Pi
     """Fallback single gap resolution method"""
     
     # Template matching for common patterns
-    code_suggestions = []
     gaps_lower = gaps.lower()
     
-    if "load" in gaps_lower or "storage" in gaps_lower:
-        code_suggestions.append(GAP_TEMPLATES["load"])
-    if "monitoring" in gaps_lower or "logging" in gaps_lower:
-        code_suggestions.append(GAP_TEMPLATES["monitoring"])
-    if "testing" in gaps_lower or "pytest" in gaps_lower:
-        code_suggestions.append(GAP_TEMPLATES["testing"])
-    if "collaboration" in gaps_lower or "api" in gaps_lower:
-        code_suggestions.append(GAP_TEMPLATES["collaboration"])
-    if "partitioning" in gaps_lower or "spark" in gaps_lower:
-        code_suggestions.append(GAP_TEMPLATES["partitioning"])
-    if "validation" in gaps_lower or "quality" in gaps_lower:
-        code_suggestions.append(GAP_TEMPLATES["validation"])
+    # One tokenize pass + hashed set intersection against the trigger table
+    tokens = set(_WORD_RE.findall(gaps_lower))
+    hits = {TEMPLATE_TRIGGERS[t] for t in tokens & TEMPLATE_TRIGGERS.keys()}
+    code_suggestions = [template for key, template in GAP_TEMPLATES.items() if key in hits]
     
     # Enhance context with templates
     enhanced_context = context
@@ -331,11 +427,11 @@ async def single_gap_fallback(gaps: str, context: str, history: List[str]) -> Pi
         enhanced_context += f"\n\nSuggested code patterns:\n" + "\n".join(code_suggestions)
     
     try:
-        return await chain.ainvoke({
+        return await limited_ainvoke(chain, {
             "gaps": gaps,
             "context": enhanced_context,
             "history": "; ".join(history[-3:]),  # Last 3 attempts
-            "format_instructions": parser.get_format_instructions()
+            "format_instructions": _FORMAT_INSTRUCTIONS
         })
     except Exception as e:
         print(f"⚠️ Gap resolver parsing error: {e}")
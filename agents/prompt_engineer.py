@@ -1,27 +1,29 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 from config import MODELS, PipelineStep
+from agents._llm_cache import with_llm_cache
 
 parser = PydanticOutputParser(pydantic_object=PipelineStep)
+_FORMAT_INSTRUCTIONS = parser.get_format_instructions()  # Immutable per schema; computed once
 
 refine_template = """
 Refine this user prompt for a data engineering task: {user_prompt}.
 Make it more structured, incorporate ETL best practices (e.g., data lineage, scalability hints), and optimize for multi-agent collaboration.
-Add few-shot examples if helpful. Critique and iterate if needed for precision.
+Add few-shot examples if helpful.
+
+Work in one pass: first draft a refined version, then critique it for precision and gaps,
+then write the final improved version. Only the final version goes in the output.
 
 {format_instructions}
 
-Output as a PipelineStep with step_name='refined_prompt', code_snippet='', rationale=refined prompt text.
+Output as a PipelineStep with step_name='refined_prompt', code_snippet='', rationale=final refined prompt text.
 """
 
 prompt = ChatPromptTemplate.from_template(refine_template)
 
-chain = prompt | MODELS["prompt_engineer"] | parser
+chain = prompt | with_llm_cache(MODELS["prompt_engineer"]) | parser  # Deterministic per user prompt
 
 
 async def refine_prompt(user_prompt: str) -> PipelineStep:
-    # Internal iteration for meta-refinement
-    initial = await chain.ainvoke({"user_prompt": user_prompt, "format_instructions": parser.get_format_instructions()})  # Async for scalability
-    critique_prompt = f"Critique and improve: {initial.rationale}"
-    refined = await chain.ainvoke({"user_prompt": critique_prompt, "format_instructions": parser.get_format_instructions()})
-    return refined
+    # Draft -> critique -> final in a single request (was two sequential calls)
+    return await chain.ainvoke({"user_prompt": user_prompt, "format_instructions": _FORMAT_INSTRUCTIONS})  # Async for scalability
@@ -1,24 +1,32 @@
 # agents/transformer.py
 import asyncio
+import functools
 import os
 from langchain_core.prompts import ChatPromptTemplate
+from pydantic_core import to_json
 from langchain_core.output_parsers import PydanticOutputParser
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from config import MODELS, PipelineStep, DATA_DIR, INDEX_DIR
-from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
-
-# Chroma for RAG: Retrieve transform rules (e.g., "encode categoricals with one-hot")
-embeddings = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
-vectorstore = Chroma(
-    persist_directory=str(INDEX_DIR / "transform_rules"), embedding_function=embeddings
-)
-retriever = vectorstore.as_retriever(
-    search_kwargs={"k": 3}
-)  # Top 3 for focused reasoning
+from config import MODELS, PipelineStep, INDEX_DIR
+from agents._mcp import call_mcp_tool
+from agents._rag import add_texts_once, get_cached_openai_embeddings
+
+# Chroma for RAG: Retrieve transform rules (e.g., "encode categoricals with one-hot").
+# Opened on first use, not at import (Chroma client + embeddings client; tests patch these)
+@functools.cache
+def _vectorstore():
+    from langchain_chroma import Chroma
+
+    embeddings = get_cached_openai_embeddings()  # Repeat texts/queries skip the API
+    return Chroma(
+        persist_directory=str(INDEX_DIR / "transform_rules"), embedding_function=embeddings
+    )
+
+
+@functools.cache
+def _retriever():
+    return _vectorstore().as_retriever(search_kwargs={"k": 3})  # Top 3 for focused reasoning
 
 parser = PydanticOutputParser(pydantic_object=PipelineStep)
+_FORMAT_INSTRUCTIONS = parser.get_format_instructions()  # Immutable per schema; computed once
 
 transform_template = """
 Transform cleaned dataset from {dataset_path} (current format: {current_format}).
@@ -45,34 +53,39 @@ CRITICAL: Return ONLY valid JSON without any additional text, explanations, mark
 
 prompt = ChatPromptTemplate.from_template(transform_template)
 
-chain = prompt | MODELS["transformer"] | parser
+# MCP metadata fields the prompt actually uses; anything else is just prompt tokens
+_META_KEYS = ("size_mb", "new_features", "scaled_cols", "sharding_hint")
+
+@functools.cache
+def _chain():
+    """Transformer chain, built (with its model) on first use."""
+    return prompt | MODELS["transformer"] | parser
 
 
 async def transform_data(dataset_path: str, clean_step: PipelineStep, feedback_context: str = "", current_format: str = "csv") -> PipelineStep:
     # RAG: Fetch transform rules (e.g., "derive profit = revenue - cost")
     query = f"Transform rules for {os.path.basename(dataset_path)}"
-    retrieved_docs = retriever.invoke(query)
-    transform_rules = "\n".join([doc.page_content for doc in retrieved_docs])
-
-    # MCP tool call: Use transform_data for standardized features (scalable to ML frameworks)
-    async with streamablehttp_client("http://localhost:8000/mcp") as (read, write, _):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            mcp_result = await session.call_tool(
-                "transform_data",
-                {"file_path": dataset_path, "clean_metadata": clean_step.model_dump()},
-            )
-            structured_transform = mcp_result.structuredContent  # Pydantic-validated
-
-    # Adaptive transform: Check size, hint parallelism (swarmlet prep for distributed features)
-    if structured_transform and isinstance(structured_transform, dict) and "metadata" in structured_transform and structured_transform["metadata"]:
-        file_size = structured_transform["metadata"].get("size_mb", 0)
-        rationale_add = structured_transform["metadata"].get(
-            "sharding_hint", "Small dataset; single-pass transform."
-        )
+
+    # MCP tool call: Use transform_data for standardized features (persistent session, scalable to ML frameworks)
+    # Independent I/O: embed + retrieve concurrently with the MCP round trip
+    retrieved_docs, mcp_result = await asyncio.gather(
+        _retriever().ainvoke(query),
+        call_mcp_tool(
+            "transform_data",
+            {"file_path": dataset_path, "clean_metadata": clean_step.model_dump()},
+        ),
+    )
+    structured_transform = mcp_result.structuredContent  # Pydantic-validated
+    transform_rules = "\n".join(doc.page_content for doc in retrieved_docs)
+
+    # Adaptive transform: hint parallelism (swarmlet prep for distributed features).
+    # Null-safe: cold MCP responses may omit or empty "metadata"
+    metadata = (structured_transform or {}).get("metadata") or {}
+    rationale_add = metadata.get("sharding_hint", "Small dataset; single-pass transform.")
+    if structured_transform:
+        clean_metadata = to_json({k: metadata[k] for k in _META_KEYS if k in metadata}, fallback=str).decode()
     else:
-        file_size = 0
-        rationale_add = "Small dataset; single-pass transform."
+        clean_metadata = "No metadata available"
 
     # Get previous step output info for continuity
     previous_output_info = f"Previous output: {clean_step.output_file_path} (format: {clean_step.output_format})" if clean_step.output_file_path else "No previous output file specified"
@@ -80,15 +93,15 @@ async def transform_data(dataset_path: str, clean_step: PipelineStep, feedback_c
     # Async invoke for scalability (e.g., concurrent feature gen in high-volume ETL)
     feedback_prompt = f"\nFeedback Context: {feedback_context}" if feedback_context else ""
     try:
-        result = await chain.ainvoke(
+        result = await _chain().ainvoke(
             {
                 "dataset_path": dataset_path,
                 "current_format": current_format,
                 "previous_output_info": previous_output_info,
-                "clean_metadata": str(structured_transform.get("metadata", {})) if structured_transform else "No metadata available",
+                "clean_metadata": clean_metadata,
                 "transform_rules": transform_rules + "\n" + rationale_add,
                 "feedback_context": feedback_prompt,
-                "format_instructions": parser.get_format_instructions(),
+                "format_instructions": _FORMAT_INSTRUCTIONS,
             }
         )
         return result
@@ -107,4 +120,5 @@ async def transform_data(dataset_path: str, clean_step: PipelineStep, feedback_c
 
 # Pre-build index (call in main.py; scalable: Batch embed rules)
 def build_transform_index(docs: list[str]):
-    vectorstore.add_texts(docs)  # Embed; extensible to Neo4j for relational features
+    # Extensible to Neo4j for relational features
+    add_texts_once(_vectorstore(), docs, str(INDEX_DIR / "transform_rules"))
@@ -1,13 +1,18 @@
 # agents/validator.py
 import asyncio
+import functools
+import re
 from typing import List
 from langchain_core.prompts import ChatPromptTemplate
+from pydantic_core import to_json
 from langchain_core.output_parsers import PydanticOutputParser
 from config import MODELS, PipelineStep
-from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
+from agents._limits import bounded_invoke
+from agents._mcp import call_mcp_tool
+from agents._result_cache import ResultCache, result_key
 
 parser = PydanticOutputParser(pydantic_object=PipelineStep)
+_FORMAT_INSTRUCTIONS = parser.get_format_instructions()  # Immutable per schema; computed once
 
 validate_template = """
 Evaluate pipeline steps: {pipeline_steps}.
@@ -21,7 +26,21 @@ IMPORTANT: Return ONLY valid JSON without any additional text or explanations.
 
 prompt = ChatPromptTemplate.from_template(validate_template)
 
-chain = prompt | MODELS["validator"] | parser
+# Multi-model debate: one chain per voting model, assembled on first use (not per vote/round)
+VOTE_MODEL_KEYS = ("validator", "cleaner", "transformer")
+
+
+@functools.lru_cache(maxsize=None)
+def get_chain(role: str):
+    """prompt | MODELS[role] | parser, memoized per role; None if the role's model is unavailable."""
+    model = MODELS.get(role)
+    return None if model is None else prompt | model | parser
+
+# Debate rounds can resubmit identical steps; an identical (model, task, steps) reuses the earlier vote
+vote_cache = ResultCache()
+
+# Whole-word, case-insensitive "yes" (no lowercased copy; "yesterday" doesn't count)
+_YES_RE = re.compile(r"\byes\b", re.I)
 
 
 from dataclasses import dataclass
@@ -55,32 +74,36 @@ async def validate_steps(
     pipeline_steps: List[PipelineStep], validation_context: str
 ) -> PipelineStep:
     # MCP integration: Call validate_data tool for structured checks (scalable: Externalize validation logic)
-    async with streamablehttp_client("http://localhost:8000/mcp") as (read, write, _):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            mcp_result = await session.call_tool(
-                "validate_data",
-                {"steps": [step.model_dump() for step in pipeline_steps]},
-            )
-            structured_valid = (
-                mcp_result.structuredContent
-            )  # Pydantic: valid bool + issues list
+    # Reuses the persistent session (no per-call connect + initialize handshake)
+    dumped_steps = [step.as_dict() for step in pipeline_steps]  # Shared by MCP + every vote
+    mcp_result = await call_mcp_tool("validate_data", {"steps": dumped_steps})
+    structured_valid = (
+        mcp_result.structuredContent
+    )  # Pydantic: valid bool + issues list
+
+    # JSON (Rust encoder via pydantic-core) rather than Python repr of the structured result
+    enriched_context = validation_context + "\nMCP Validation: " + to_json(structured_valid, fallback=str).decode()
 
-    enriched_context = validation_context + "\nMCP Validation: " + str(structured_valid)
+    vote_chains = {key: get_chain(key) for key in VOTE_MODEL_KEYS}
+    vote_chains = {key: chain for key, chain in vote_chains.items() if chain is not None}
+
+    # Exact cache key: model + task + full step contents
+    steps_json = to_json(dumped_steps, fallback=str).decode()
 
     # Multi-model debate: Async parallel invokes for scalability in large ensembles
-    model_keys = ["validator", "cleaner", "transformer"]
-    
-    # Create separate chains for each model to ensure proper model switching
     async def get_vote_for_model(model_key: str):
-        model_chain = prompt | MODELS[model_key] | parser
         try:
-            return await model_chain.ainvoke(
-                {
-                    "pipeline_steps": [step.model_dump() for step in pipeline_steps],
-                    "validation_context": enriched_context,
-                    "format_instructions": parser.get_format_instructions(),
-                }
+            return await vote_cache.aget_or_compute(
+                result_key(model_key, validation_context, steps_json),
+                lambda: bounded_invoke(
+                    model_key,
+                    vote_chains[model_key],
+                    {
+                        "pipeline_steps": dumped_steps,
+                        "validation_context": enriched_context,
+                        "format_instructions": _FORMAT_INSTRUCTIONS,
+                    },
+                ),
             )
         except Exception as e:
             print(f"⚠️ Validation parsing error for {model_key}: {e}")
@@ -91,13 +114,14 @@ async def validate_steps(
                 rationale=f"Validation failed for {model_key} - parsing error. Pipeline needs refinement."
             )
     
+    # Distinct models voting concurrently: ~one model latency per round, not N
     votes = await asyncio.gather(
-        *[get_vote_for_model(model_key) for model_key in model_keys]
+        *[get_vote_for_model(model_key) for model_key in vote_chains]
     )
 
     structured_votes = [
         {
-            "vote": "Yes" if "yes" in v.rationale.lower() else "No",
+            "vote": "Yes" if _YES_RE.search(v.rationale) else "No",
             "rationale": v.rationale,
         }
         for v in votes
@@ -109,7 +133,7 @@ async def validate_steps(
     )
     rationale = (
         f"Consensus: {sum(1 for v in structured_votes if v['vote'] == 'Yes')}/{len(structured_votes)} yes votes. Details: "
-        + " | ".join([v["rationale"] for v in structured_votes])
+        + " | ".join(v["rationale"] for v in structured_votes)
     )
 
     return PipelineStep(
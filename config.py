@@ -1,9 +1,11 @@
 from pathlib import Path
-from pydantic import BaseModel, Field
+from functools import cached_property
+from pydantic import BaseModel, ConfigDict, Field
 from langchain.chat_models import init_chat_model
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 import os
+import threading
 
 # Load environment variables
 load_dotenv()
@@ -25,6 +27,22 @@ class PipelineStep(BaseModel):
         description="Format of output file (csv, parquet, etc.)", default="csv"
     )
 
+    # Steps are never mutated after creation; frozen makes the cached dump below safe
+    model_config = ConfigDict(frozen=True)
+
+    @cached_property
+    def _dump(self) -> Dict[str, Any]:
+        return self.model_dump()
+
+    def as_dict(self) -> Dict[str, Any]:
+        """model_dump() computed once per step (shared dict: treat as read-only)."""
+        return self._dump
+
+    def model_copy(self, *, update: Optional[Dict[str, Any]] = None, deep: bool = False) -> "PipelineStep":
+        copy = super().model_copy(update=update, deep=deep)
+        copy.__dict__.pop("_dump", None)  # Updated fields: don't inherit a stale dump
+        return copy
+
 
 # Model configurations
 MODEL_CONFIGS = [
@@ -72,11 +90,10 @@ MODEL_CONFIGS = [
     ##},
 ]
 
-# Initialize models with error handling
-MODELS: Dict[str, Any] = {}
-for config in MODEL_CONFIGS:
+def _init_model(config: Dict[str, Any]) -> Any:
+    """Build one role's chat model; None if the provider can't be initialized."""
     try:
-        MODELS[config["agent_role"]] = init_chat_model(
+        return init_chat_model(
             model=config["model"],
             model_provider=config["model_provider"],
             **config["config"],
@@ -84,4 +101,49 @@ for config in MODEL_CONFIGS:
     except Exception as e:
         print(f"Error initializing {config['agent_role']}: {e}")
         # Fallback: Use a local model or skip
-        MODELS[config["agent_role"]] = None  # Placeholder for fallback logic
+        return None  # Placeholder for fallback logic
+
+
+class _LazyModels(dict):
+    """role -> chat model, initialized on first access.
+
+    Importing config (e.g. from MCP-only scripts) no longer builds every provider client;
+    each role pays client setup once, when an agent first asks for it.
+    """
+
+    def __init__(self, configs: List[Dict[str, Any]]):
+        super().__init__()
+        self._configs = {config["agent_role"]: config for config in configs}
+        self._lock = threading.RLock()
+
+    def __missing__(self, role: str) -> Any:
+        if role not in self._configs:
+            raise KeyError(role)
+        with self._lock:
+            if not dict.__contains__(self, role):
+                dict.__setitem__(self, role, _init_model(self._configs[role]))
+        return dict.__getitem__(self, role)
+
+    def get(self, role: str, default: Any = None) -> Any:
+        return self[role] if role in self else default
+
+    def __contains__(self, role: object) -> bool:
+        return role in self._configs or dict.__contains__(self, role)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def keys(self):
+        return list(dict.fromkeys([*self._configs, *dict.keys(self)]))
+
+    def values(self):
+        return [self[role] for role in self.keys()]
+
+    def items(self):
+        return [(role, self[role]) for role in self.keys()]
+
+
+MODELS: Dict[str, Any] = _LazyModels(MODEL_CONFIGS)
@@ -1,6 +1,8 @@
 # graph.py: LangGraph workflow for data engineering swarm with dynamic tool discovery
-from typing import TypedDict, List, Dict, Any
-from langgraph.graph import StateGraph, END
+from collections import deque
+from itertools import islice
+from typing import TypedDict, List, Dict, Any, Optional, Tuple, Deque
+from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from config import PipelineStep
 from agents.prompt_engineer import refine_prompt
@@ -9,28 +11,51 @@ from agents.cleaner import clean_data
 from agents.transformer import transform_data
 from agents.validator import validate_steps
 from agents.gap_resolver import resolve_persistent_gaps
-from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
+from agents._mcp import list_mcp_tools
 import asyncio
 import functools
+import hashlib
+import json
+import operator
+import re
+import time
 import structlog
 
-def calculate_semantic_similarity(gaps1, gaps2):
-    """Calculate semantic similarity between gap sets using keyword overlap"""
-    keywords1, keywords2 = set(), set()
-    key_terms = ["validation", "error", "handling", "transformation", "missing", "data", "pipeline", "quality", "incomplete"]
-    
-    for gap in gaps1:
-        keywords1.update(term for term in key_terms if term in gap.lower())
-    for gap in gaps2:
-        keywords2.update(term for term in key_terms if term in gap.lower())
-    
-    if not keywords1 or not keywords2:
+# Gap vocabulary for persistence detection; one bit per term
+KEY_TERMS = ("validation", "error", "handling", "transformation", "missing", "data", "pipeline", "quality", "incomplete")
+TERM_BITS = {term: 1 << i for i, term in enumerate(KEY_TERMS)}
+
+
+@functools.lru_cache(maxsize=1024)
+def _gap_mask(gap: str) -> int:
+    """Bitmask of KEY_TERMS present in one gap (cached: history entries recur across rounds)"""
+    gap_lower = gap.lower()
+    mask = 0
+    for term, bit in TERM_BITS.items():
+        if term in gap_lower:
+            mask |= bit
+    return mask
+
+
+def _mask_similarity(mask1: int, mask2: int) -> float:
+    """Jaccard over term bitmasks (popcount of AND / OR)"""
+    if not mask1 or not mask2:
         return 0.0
-    
-    intersection = len(keywords1 & keywords2)
-    union = len(keywords1 | keywords2)
-    return intersection / union if union > 0 else 0.0
+    return (mask1 & mask2).bit_count() / (mask1 | mask2).bit_count()
+
+
+def calculate_semantic_similarity(gaps1, gaps2):
+    """Calculate semantic similarity between gap sets using keyword overlap (Jaccard over bitmasks)"""
+    mask1 = functools.reduce(operator.or_, map(_gap_mask, gaps1), 0)
+    mask2 = functools.reduce(operator.or_, map(_gap_mask, gaps2), 0)
+    return _mask_similarity(mask1, mask2)
+
+# Gap phrases in "No" vote rationales, compiled once (single alternation scan per sentence)
+GAP_RE = re.compile(r"\b(?:missing|lacks|incomplete|should include|needs|requires|absent)\b")
+
+# Module-level logger: structlog's processor chain resolves once (cache_logger_on_first_use);
+# events are filtered before rendering, so suppressed levels cost no formatting
+logger = structlog.get_logger('pipeline')
 
 # Debate Configuration
 MAX_DEBATE_ROUNDS = 3  # Maximum number of consensus rounds before force-exit (LangGraph has 25-step limit)
@@ -52,11 +77,13 @@ class AgentState(TypedDict):
         str, str
     ] = {}  # New: Dynamic tool map (e.g., {"ingest": "load_csv"})
     feedback_summary: str = ""  # Aggregated feedback from all agents
-    feedback_history: List[str] = []  # Raw feedback for trend analysis
+    feedback_history: Deque[str]  # Raw feedback for trend analysis (last FEEDBACK_HISTORY_LEN rounds)
+    feedback_masks: Deque[int]  # KEY_TERMS bitmask per feedback_history entry (parallel deque)
     gap_escalation_count: int = 0  # Track escalations to prevent infinite loops
     current_data_path: str = "data/sales_data.csv"  # Track current dataset file path
     data_format: str = "csv"  # Track current data format (csv, parquet, etc.)
     pipeline_metadata: Dict[str, str] = {}  # Track metadata between agents
+    last_votes: Dict[str, Any] = {}  # Previous debate round: {"key", "step", "votes", "upto"} for vote reuse
 
 
 # Invented paradigm: Hybrid wrapper for sync/async agents (scales to mixed workloads in ETL swarms)
@@ -72,42 +99,57 @@ def hybrid_async_node(func):
     return wrapper
 
 
+# Agent role -> MCP tool it runs; new tools only need an entry here
+ROLE_TO_TOOL = {
+    "ingest": "load_csv",
+    "clean": "clean_data",
+    "transform": "transform_data",
+    "validate": "validate_data",
+}
+# Placeholder per role when the server advertises none of them (load_csv -> default_load)
+FALLBACK_TOOLS = {role: f"default_{tool.split('_')[0]}" for role, tool in ROLE_TO_TOOL.items()}
+
+# (monotonic timestamp, tool name -> description) from the last successful listing
+_DISCOVERY_CACHE: Optional[Tuple[float, Dict[str, str]]] = None
+DISCOVERY_TTL_SECONDS = 600
+
+
+# Rounds of raw feedback kept in state; escalation only looks at the last 3
+FEEDBACK_HISTORY_LEN = 5
+
+
+def new_feedback_window(items=()) -> Deque:
+    """Bounded feedback deque (reuses one that already is, so appends stay O(1))."""
+    if isinstance(items, deque) and items.maxlen == FEEDBACK_HISTORY_LEN:
+        return items
+    return deque(items, maxlen=FEEDBACK_HISTORY_LEN)
+
+
 # Dynamic discovery node: Query MCP for tools, map to agents (creative swarm discovery paradigm)
 async def discovery_node(state: AgentState) -> AgentState:
+    global _DISCOVERY_CACHE
     try:
-        async with streamablehttp_client("http://localhost:8000/mcp") as (
-            read,
-            write,
-            _,
-        ):
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-                tools_resp = await session.list_tools()
-                tools = {tool.name: tool.description for tool in tools_resp.tools}
-
-        # Map discovered tools to agent roles (scalable: Auto-assign based on desc keywords)
-        state["discovered_tools"] = {}
-        if "load_csv" in tools:
-            state["discovered_tools"]["ingest"] = "load_csv"
-        if "clean_data" in tools:
-            state["discovered_tools"]["clean"] = "clean_data"
-        if "transform_data" in tools:
-            state["discovered_tools"]["transform"] = "transform_data"
-        if "validate_data" in tools:
-            state["discovered_tools"]["validate"] = "validate_data"
+        # Tool set is static per server run: reuse a recent listing, else ask the shared session
+        now = time.monotonic()
+        if _DISCOVERY_CACHE is not None and now - _DISCOVERY_CACHE[0] < DISCOVERY_TTL_SECONDS:
+            tools = _DISCOVERY_CACHE[1]
+        else:
+            tools = await list_mcp_tools()
+            _DISCOVERY_CACHE = (now, tools)
+
+        # Map discovered tools to agent roles
+        state["discovered_tools"] = {role: tool for role, tool in ROLE_TO_TOOL.items() if tool in tools}
 
         # Creative: If tools missing, fallback or spawn sub-discovery (e.g., query alt MCP endpoints)
         if not state["discovered_tools"]:
-            print("Warning: No tools discovered; using static fallbacks.")
-            state["discovered_tools"] = {
-                "ingest": "default_load",
-                "clean": "default_clean",
-            }  # Etc.
+            logger.warning("tool_discovery_empty", fallback="static")
+            state["discovered_tools"] = dict(FALLBACK_TOOLS)
     except Exception as e:
-        print(f"Discovery failed: {e}; using fallbacks.")
+        logger.warning("tool_discovery_failed", error=str(e), fallback="none")
         state["discovered_tools"] = {}  # Handle gracefully for ETL resilience
 
-    return state
+    # Only the key this branch owns (runs in parallel with prompt_node)
+    return {"discovered_tools": state["discovered_tools"]}
 
 
 # Agent nodes (async for scalability; use discovered tools in calls if needed)
@@ -119,7 +161,8 @@ async def prompt_node(state: AgentState) -> AgentState:
     refined = await refine_prompt(task_with_feedback)
     state["refined_prompt"] = refined.rationale
     state["pipeline_steps"].append(refined)
-    return state
+    # Only the keys this branch owns (runs in parallel with discovery_node on the first pass)
+    return {"refined_prompt": state["refined_prompt"], "pipeline_steps": state["pipeline_steps"]}
 
 
 @hybrid_async_node
@@ -127,7 +170,7 @@ async def ingest_node(state: AgentState) -> AgentState:
     # Pass feedback context to help ingestor adapt to validation gaps
     step = await ingest_data(
         state["current_data_path"], 
-        state.get("feedback_summary", ""),
+        state["feedback_summary"],
         state["data_format"]
     )
     state["pipeline_steps"].append(step)
@@ -148,7 +191,7 @@ async def clean_node(state: AgentState) -> AgentState:
     step = await clean_data(
         state["current_data_path"], 
         last_step, 
-        state.get("feedback_summary", ""),
+        state["feedback_summary"],
         state["data_format"]
     )
     state["pipeline_steps"].append(step)
@@ -169,7 +212,7 @@ async def transform_node(state: AgentState) -> AgentState:
     step = await transform_data(
         state["current_data_path"], 
         last_step, 
-        state.get("feedback_summary", ""),
+        state["feedback_summary"],
         state["data_format"]
     )
     state["pipeline_steps"].append(step)
@@ -185,65 +228,83 @@ async def transform_node(state: AgentState) -> AgentState:
 
 @hybrid_async_node
 async def debate_node(state: AgentState) -> AgentState:
-    logger = structlog.get_logger('pipeline')
     logger.info("debate_node_started", round=state["debate_rounds"] + 1)
     
-    step, votes = await validate_steps(state["pipeline_steps"], state["refined_prompt"])
+    # Same refined prompt + same round output as last round -> votes would reproduce; reuse them.
+    # A re-debate (route's debate -> debate edge) adds no work steps: it always re-votes, since
+    # reuse would only replay the last round and append a duplicate validation step
+    last = state.get("last_votes") or {}
+    round_steps = state["pipeline_steps"][last.get("upto", 0):]
+    if round_steps:
+        round_key = hashlib.sha256(
+            json.dumps([state["refined_prompt"], [s.as_dict() for s in round_steps]], default=str).encode("utf-8")
+        ).hexdigest()
+    else:
+        round_key = last.get("key")  # Same pipeline as the round that set it
+    if round_steps and last.get("key") == round_key:
+        logger.info("debate_votes_reused", round=state["debate_rounds"] + 1)
+        step, votes = last["step"], last["votes"]
+    else:
+        step, votes = await validate_steps(state["pipeline_steps"], state["refined_prompt"])
     state["pipeline_steps"].append(step)
+    state["last_votes"] = {"key": round_key, "step": step, "votes": votes, "upto": len(state["pipeline_steps"])}
     state["debate_rounds"] += 1
 
+    # Decompose the vote records once into parallel columns; each scan below touches one
+    vote_labels = [v["vote"] == "Yes" for v in votes]
+    vote_rationales = [v["rationale"] for v in votes]
+
     # Proper consensus detection based on validator's actual majority vote
-    state["consensus_reached"] = sum(1 for v in votes if "Yes" in v) > len(votes) / 2
+    state["consensus_reached"] = sum(vote_labels) * 2 > len(vote_labels)
 
-    # Enhanced gap extraction from structured votes
+    # Enhanced gap extraction from structured votes: one regex scan per rationale sentence
     gaps = set()
-    for vote in votes:
-        if vote["vote"] == "No":
-            # Extract gaps from rationale using improved keyword matching
-            rationale = vote["rationale"].lower()
-            gap_keywords = ["missing", "lacks", "incomplete", "should include", "needs", "requires", "absent"]
-            for line in rationale.split("."):
-                if any(keyword in line for keyword in gap_keywords):
+    for is_yes, rationale in zip(vote_labels, vote_rationales):
+        if not is_yes:
+            for line in rationale.lower().split("."):
+                if GAP_RE.search(line):
                     gaps.add(line.strip())
     
     # Create compact feedback summary
     unique_gaps = list(gaps)[:5]  # Limit to top 5 for token efficiency
     state["feedback_summary"] = "MUST address these gaps: " + "; ".join(unique_gaps) if unique_gaps else ""
     
-    # Store raw feedback for escalation detection
+    # Store raw feedback for escalation detection, with its term bitmask alongside
+    # (no ';' in KEY_TERMS, so the whole-string mask equals the OR of per-gap masks)
     current_feedback = "; ".join(unique_gaps)
-    state["feedback_history"].append(current_feedback)
+    history = state["feedback_history"] = new_feedback_window(state.get("feedback_history", ()))
+    masks = state["feedback_masks"] = new_feedback_window(state.get("feedback_masks", ()))
+    history.append(current_feedback)
+    masks.append(_gap_mask(current_feedback))
     
     # Check for persistent gaps (escalation trigger)
-    if len(state["feedback_history"]) > 2 and state["gap_escalation_count"] < 2:
-        recent_feedback = state["feedback_history"][-3:]
-        # Semantic similarity check for persistent gap patterns
-        recent_gaps = [set(feedback.split(";")) for feedback in recent_feedback if feedback]
-        if len(recent_gaps) >= 2:
-            similarity = calculate_semantic_similarity(recent_gaps[0], recent_gaps[-1])
+    if len(history) > 2 and state["gap_escalation_count"] < 2:
+        # Semantic similarity check for persistent gap patterns (non-empty feedback in the last 3 rounds)
+        recent_masks = [
+            mask for feedback, mask in islice(zip(history, masks), len(history) - 3, None) if feedback
+        ]
+        if len(recent_masks) >= 2:
+            similarity = _mask_similarity(recent_masks[0], recent_masks[-1])
             if similarity > 0.3 and len(unique_gaps) > 0:
                 logger.info("persistent_gaps_detected", 
                            similarity=similarity, 
                            gap_count=len(unique_gaps),
                            escalation_count=state["gap_escalation_count"])
-                print(f"🔄 Persistent gaps detected (similarity: {similarity:.2f}). Triggering meta-swarmlet resolver...")
                 state["gap_escalation_count"] += 1
                 
                 # Escalate to gap resolver (async for scalability)
                 resolver_step = await resolve_persistent_gaps(
                     gaps=current_feedback,
                     context=state["refined_prompt"],
-                    history=state["feedback_history"]
+                    history=list(history)
                 )
                 state["pipeline_steps"].append(resolver_step)
                 logger.info("gap_resolver_generated", 
                            step_name=resolver_step.step_name,
                            output_format=resolver_step.output_format)
-                print(f"🛠️ Gap resolver generated: {resolver_step.step_name}")
                 
                 # INTRA-ROUND VALIDATION: Immediately validate the resolver solution
                 logger.info("intra_round_validation_started")
-                print("🔍 Intra-round validation: Testing resolver solution...")
                 from agents.validator import validate_pipeline
                 validation_result = await validate_pipeline(
                     pipeline_steps=state["pipeline_steps"],
@@ -255,15 +316,17 @@ async def debate_node(state: AgentState) -> AgentState:
                            vote_count=validation_result.vote_count)
                 
                 if validation_result.consensus_reached:
-                    print("✅ Resolver solution passed immediate validation!")
                     state["consensus_reached"] = True
                     state["feedback_summary"] = f"Resolver solution validated: {resolver_step.step_name}"
                 else:
-                    print(f"⚠️ Resolver solution needs refinement: {validation_result.rationale[:100]}...")
                     state["feedback_summary"] = f"Resolver applied but needs refinement: {validation_result.rationale[:200]}"
     return state
 
 
+# route() result -> next node, built once for add_conditional_edges
+_ROUTES = {"prompt": "prompt", "debate": "debate", END: END}
+
+
 # Conditional routing: Loop if no consensus (scalable: Max rounds prevent infinite loops)
 def route(state: AgentState) -> str:
     if state["consensus_reached"]:
@@ -273,12 +336,16 @@ def route(state: AgentState) -> str:
             f"\n⚠️  Maximum debate rounds ({MAX_DEBATE_ROUNDS}) reached. Forcing consensus..."
         )
         return END
+    elif not state["feedback_summary"]:
+        # No gaps to feed back: prompt/ingest/clean/transform would rerun on unchanged inputs,
+        # so re-debate the assembled pipeline directly
+        return "debate"
     return "prompt"  # Re-refine; dynamic: Route to weak agent based on discovered tools
 
 
 # Build graph (async nodes for parallel scalability in large swarms)
 graph = StateGraph(state_schema=AgentState, initial_state={
-    'feedback_history': [], 
+    'feedback_history': new_feedback_window(), 
     'gap_escalation_count': 0,
     'current_data_path': 'data/sales_data.csv',
     'data_format': 'csv',
@@ -291,13 +358,16 @@ graph.add_node("clean", clean_node)
 graph.add_node("transform", transform_node)
 graph.add_node("debate", debate_node)
 
-# Edges: Discovery first, then sequential ETL with debate loop
-graph.set_entry_point("discovery")
-graph.add_edge("discovery", "prompt")
+# Edges: discovery and prompt refinement are data-independent, so they run as parallel
+# branches from START (they write disjoint state keys); then sequential ETL with debate loop.
+# Separate edges into ingest (not a join) so debate's loop back through prompt alone still proceeds
+graph.add_edge(START, "discovery")
+graph.add_edge(START, "prompt")
+graph.add_edge("discovery", "ingest")
 graph.add_edge("prompt", "ingest")
 graph.add_edge("ingest", "clean")
 graph.add_edge("clean", "transform")
 graph.add_edge("transform", "debate")
-graph.add_conditional_edges("debate", route, {"prompt": "prompt", END: END})
+graph.add_conditional_edges("debate", route, _ROUTES)
 
 app = graph.compile()  # Ready for async invoke in main.py
@@ -1,20 +1,23 @@
 # main.py
+# Only light stdlib imports at module level: the graph/agent modules (models, vector stores,
+# embedders) and logging setup load inside the functions that use them, so --help stays instant
 import asyncio
 import argparse
-import json
-import logging
-import structlog
+import sys
 from datetime import datetime
 from pathlib import Path
-from graph import app
-from agents.data_ingestor import build_rag_index
-from agents.cleaner import build_cleaning_index
-from agents.transformer import build_transform_index
+
+DEFAULT_TASK = "Build ETL pipeline for sales_data.csv"
 
 
 # Setup structured logging for observability
 def setup_structured_logging():
     """Configure structured JSON logging for pipeline observability"""
+    import atexit
+    import logging
+    import queue
+    import structlog
+    from logging.handlers import QueueHandler, QueueListener
     
     # Create logs directory
     logs_dir = Path("logs")
@@ -33,10 +36,16 @@ def setup_structured_logging():
     file_handler.setLevel(logging.INFO)
     file_handler.setFormatter(logging.Formatter('%(message)s'))
     
-    # Create a specific logger for our pipeline events
+    # Create a specific logger for our pipeline events; records go through a queue so the
+    # event loop never waits on file writes (a listener thread owns the FileHandler)
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(log_queue, file_handler)
+    listener.start()
+    atexit.register(listener.stop)  # Drains queued records before exit
+    
     pipeline_logger = logging.getLogger('pipeline')
     pipeline_logger.setLevel(logging.INFO)
-    pipeline_logger.addHandler(file_handler)
+    pipeline_logger.addHandler(QueueHandler(log_queue))
     pipeline_logger.propagate = False  # Don't propagate to root logger
     
     # Configure structlog to use our pipeline logger
@@ -58,205 +67,220 @@ def setup_structured_logging():
     
     return logger
 
-# Pre-build all RAG indexes (scalable: Run in parallel via asyncio.gather)
-def setup_indexes():
+# Pre-build all RAG indexes: independent stores, so the (sync) builds overlap in worker threads
+async def setup_indexes():
+    import structlog
+    from agents.data_ingestor import build_rag_index
+    from agents.cleaner import build_cleaning_index
+    from agents.transformer import build_transform_index
+    from agents._rag import embed_stale_seed_docs
+
     logger = structlog.get_logger()
     logger.info("building_rag_indexes", status="started")
     
-    build_rag_index(["Sales schema: id:int, date:datetime, amount:float"])
-    build_cleaning_index(["Impute nulls with median", "Remove outliers >3SD"])
-    build_transform_index(
-        ["Scale numerics", "Encode categoricals", "Derive profit ratio"]
+    seed_docs = {
+        "schemas": ["Sales schema: id:int, date:datetime, amount:float"],
+        "cleaning_rules": ["Impute nulls with median", "Remove outliers >3SD"],
+    }
+    # Schemas + cleaning rules share the RAG embedder: one batched embed for both (stale ones only)
+    vectors = await asyncio.to_thread(embed_stale_seed_docs, seed_docs)
+    
+    await asyncio.gather(
+        asyncio.to_thread(build_rag_index, seed_docs["schemas"], vectors.get("schemas")),
+        asyncio.to_thread(build_cleaning_index, seed_docs["cleaning_rules"], vectors.get("cleaning_rules")),
+        asyncio.to_thread(  # Own (OpenAI, Chroma) embedder, so embedded separately
+            build_transform_index, ["Scale numerics", "Encode categoricals", "Derive profit ratio"]
+        ),
     )
     
     logger.info("building_rag_indexes", status="completed")
 
 
-def setup_initial_state():
+def setup_initial_state(task: str = DEFAULT_TASK) -> dict:
+    from graph import new_feedback_window
+
     return {
-        "task": "Build ETL pipeline for sales_data.csv",
+        "task": task,
         "refined_prompt": "",
         "pipeline_steps": [],
         "debate_rounds": 0,
         "consensus_reached": False,
         "discovered_tools": {},
         "feedback_summary": "",
-        "feedback_history": [],
+        "feedback_history": new_feedback_window(),
+        "feedback_masks": new_feedback_window(),
         "gap_escalation_count": 0,
         "current_data_path": "data/sales_data.csv",
         "data_format": "csv",
         "pipeline_metadata": {},
+        "last_votes": {},
     }
 
 
-async def main(verbose=False):
+# Stage node -> (completion log event, progress line) for the stream loop
+STAGE_NODES = {
+    "ingest": ("data_ingestor_completed", "📥 Data Ingestor: Data loaded and profiled"),
+    "clean": ("data_cleaner_completed", "🧹 Data Cleaner: Applied cleaning transformations"),
+    "transform": ("data_transformer_completed", "⚡ Data Transformer: Feature engineering completed"),
+}
+
+
+def _preview(text: str, limit: int) -> str:
+    """First `limit` chars of text, with an ellipsis when truncated."""
+    return text if len(text) <= limit else f"{text[:limit]}..."
+
+
+async def main(verbose=False, task=DEFAULT_TASK):
+    from pydantic_core import to_json
+    from graph import app
+    from agents._mcp import close_mcp_session
+    from agents.gap_resolver import flush_gap_writes
+
     # Initialize structured logging
     logger = setup_structured_logging()
-    logger.info("pipeline_started", verbose=verbose)
+    try:
+        logger.info("pipeline_started", verbose=verbose)
     
-    print("🚀 Starting Multi-Agent Data Engineering Swarm...")
-    print("📚 Setting up RAG indexes...")
-    setup_indexes()
+        print("🚀 Starting Multi-Agent Data Engineering Swarm...")
+        print("📚 Setting up RAG indexes...")
+        await setup_indexes()
     
-    print("🎯 Initializing pipeline state...")
-    initial_state = setup_initial_state()
-    logger.info("pipeline_state_initialized", 
-               task=initial_state["task"][:100],
-               gap_escalation_count=initial_state["gap_escalation_count"])
+        print("🎯 Initializing pipeline state...")
+        initial_state = setup_initial_state(task)
+        logger.info("pipeline_state_initialized", 
+                   task=initial_state["task"][:100],
+                   gap_escalation_count=initial_state["gap_escalation_count"])
     
-    print("🤖 Agents starting collaboration...\n")
+        print("🤖 Agents starting collaboration...\n")
     
-    final_result = None
+        final_result = None
     
-    # Stream the workflow to see progress in real-time  
-    # Set recursion limit in config to handle debate loops
-    config = {"recursion_limit": 35}
-    async for chunk in app.astream(initial_state, config=config):
-        # Each chunk represents completion of a node
-        for node_name, node_output in chunk.items():
-            if node_name == "discovery":
-                tools = node_output.get('discovered_tools', {})
-                print(f"🔍 Discovery Agent: Found {len(tools)} MCP tools")
-                if verbose and tools:
-                    print(f"   Tools: {list(tools.keys())}")
+        # Stream the workflow to see progress in real-time  
+        # Set recursion limit in config to handle debate loops
+        config = {"recursion_limit": 35}
+        async for chunk in app.astream(initial_state, config=config):
+            # Each chunk represents completion of a node; its progress lines go out in one write
+            out = []
+            for node_name, node_output in chunk.items():
+                if node_name == "discovery":
+                    tools = node_output.get('discovered_tools', {})
+                    out.append(f"🔍 Discovery Agent: Found {len(tools)} MCP tools")
+                    if verbose and tools:
+                        out.append(f"   Tools: {list(tools.keys())}")
                 
-            elif node_name == "prompt":
-                logger.info("prompt_engineer_completed", 
-                           task_length=len(node_output.get('refined_prompt', '')))
-                print(f"✏️  Prompt Engineer: Task refined and structured")
-                if verbose:
-                    refined_prompt = node_output.get('refined_prompt', '')
-                    print(f"   Refined Task: {refined_prompt[:200]}{'...' if len(refined_prompt) > 200 else ''}")
+                elif node_name == "prompt":
+                    logger.info("prompt_engineer_completed", 
+                               task_length=len(node_output.get('refined_prompt', '')))
+                    out.append(f"✏️  Prompt Engineer: Task refined and structured")
+                    if verbose:
+                        refined_prompt = node_output.get('refined_prompt', '')
+                        out.append(f"   Refined Task: {_preview(refined_prompt, 200)}")
                 
-            elif node_name == "ingest":
-                steps = node_output.get('pipeline_steps', [])
-                if steps:
-                    latest_step = steps[-1]
-                    logger.info("data_ingestor_completed", 
-                               step_name=latest_step.step_name,
-                               output_file=latest_step.output_file_path or "none",
-                               output_format=latest_step.output_format)
-                print(f"📥 Data Ingestor: Data loaded and profiled")
-                if verbose:
-                    if steps:
-                        latest_step = steps[-1]
-                        print(f"   Step: {latest_step.step_name}")
-                        print(f"   Details: {latest_step.rationale[:150]}{'...' if len(latest_step.rationale) > 150 else ''}")
+                elif node_name in STAGE_NODES:
+                    log_event, progress = STAGE_NODES[node_name]
+                    steps = node_output.get('pipeline_steps', [])
+                    latest_step = steps[-1] if steps else None
+                    if latest_step:
+                        logger.info(log_event, 
+                                   step_name=latest_step.step_name,
+                                   output_file=latest_step.output_file_path or "none",
+                                   output_format=latest_step.output_format)
+                    out.append(progress)
+                    if verbose and latest_step:
+                        out.append(f"   Step: {latest_step.step_name}")
+                        out.append(f"   Details: {_preview(latest_step.rationale, 150)}")
                 
-            elif node_name == "clean":
-                steps = node_output.get('pipeline_steps', [])
-                if steps:
-                    latest_step = steps[-1]
-                    logger.info("data_cleaner_completed", 
-                               step_name=latest_step.step_name,
-                               output_file=latest_step.output_file_path or "none",
-                               output_format=latest_step.output_format)
-                print(f"🧹 Data Cleaner: Applied cleaning transformations")
-                if verbose:
-                    if steps:
-                        latest_step = steps[-1]
-                        print(f"   Step: {latest_step.step_name}")
-                        print(f"   Details: {latest_step.rationale[:150]}{'...' if len(latest_step.rationale) > 150 else ''}")
+                elif node_name == "debate":
+                    rounds = node_output.get('debate_rounds', 0)
+                    consensus = node_output.get('consensus_reached', False)
+                    out.append(f"🗳️  Validator: Round {rounds} - {'✅ Consensus reached!' if consensus else '🔄 Continuing debate...'}")
                 
-            elif node_name == "transform":
-                steps = node_output.get('pipeline_steps', [])
-                if steps:
-                    latest_step = steps[-1]
-                    logger.info("data_transformer_completed", 
-                               step_name=latest_step.step_name,
-                               output_file=latest_step.output_file_path or "none",
-                               output_format=latest_step.output_format)
-                print(f"⚡ Data Transformer: Feature engineering completed")
-                if verbose:
+                    # Show vote details for debugging
+                    steps = node_output.get('pipeline_steps', [])
                     if steps:
                         latest_step = steps[-1]
-                        print(f"   Step: {latest_step.step_name}")
-                        print(f"   Details: {latest_step.rationale[:150]}{'...' if len(latest_step.rationale) > 150 else ''}")
-                
-            elif node_name == "debate":
-                rounds = node_output.get('debate_rounds', 0)
-                consensus = node_output.get('consensus_reached', False)
-                print(f"🗳️  Validator: Round {rounds} - {'✅ Consensus reached!' if consensus else '🔄 Continuing debate...'}")
-                
-                # Show vote details for debugging
-                steps = node_output.get('pipeline_steps', [])
-                if steps:
-                    latest_step = steps[-1]
-                    if latest_step.step_name == "validation":
-                        # Extract vote count from rationale
-                        rationale = latest_step.rationale
-                        if "yes votes" in rationale:
-                            vote_part = rationale.split("Details:")[0]
-                            print(f"   {vote_part}")
+                        if latest_step.step_name == "validation":
+                            # Extract vote count from rationale
+                            rationale = latest_step.rationale
+                            if "yes votes" in rationale:
+                                vote_part = rationale.split("Details:")[0]
+                                out.append(f"   {vote_part}")
                         
-                        if verbose:
-                            print(f"   Full Details: {rationale[:300]}{'...' if len(rationale) > 300 else ''}")
+                            if verbose:
+                                out.append(f"   Full Details: {_preview(rationale, 300)}")
         
-        # Store the final result
-        final_result = chunk
+            if out:
+                sys.stdout.write("\n".join(out) + "\n")
+        
+            # Only the last chunk matters: astream ends on the final debate node's full state
+            final_result = chunk
     
-    print("\n" + "="*80)
-    print("🎉 Pipeline Generation Complete!")
-    print("="*80)
+        print("\n" + "="*80)
+        print("🎉 Pipeline Generation Complete!")
+        print("="*80)
     
-    if final_result:
-        # Get the final state from the last chunk
-        final_state = list(final_result.values())[0]
+        if final_result:
+            # Get the final state from the last chunk
+            final_state = next(iter(final_result.values()))
         
-        # Save pipeline results to output.json
-        pipeline_output = {
-            "pipeline_steps": [step.model_dump() for step in final_state["pipeline_steps"]],
-            "debate_rounds": final_state["debate_rounds"],
-            "consensus_reached": final_state["consensus_reached"],
-            "metadata": {
-                "timestamp": datetime.now().isoformat(),
-                "gap_escalation_count": final_state.get("gap_escalation_count", 0),
-                "feedback_rounds": len(final_state.get("feedback_history", [])),
-                "total_steps": len(final_state["pipeline_steps"])
+            # Save pipeline results to output.json
+            pipeline_output = {
+                "pipeline_steps": final_state["pipeline_steps"],  # Models serialized in the encoder pass (no dict copies)
+                "debate_rounds": final_state["debate_rounds"],
+                "consensus_reached": final_state["consensus_reached"],
+                "metadata": {
+                    "timestamp": datetime.now(),
+                    "gap_escalation_count": final_state.get("gap_escalation_count", 0),
+                    "feedback_rounds": final_state["debate_rounds"],  # One feedback entry per round
+                    "total_steps": len(final_state["pipeline_steps"])
+                }
             }
-        }
         
-        with open("output.json", "w") as f:
-            json.dump(pipeline_output, f, indent=2, default=str)
+            # Rust encoder (pydantic-core) in one write; datetimes encode natively as ISO 8601
+            Path("output.json").write_bytes(to_json(pipeline_output, indent=2, fallback=str))
         
-        logger.info("pipeline_output_saved", 
-                   file="output.json", 
-                   total_steps=len(final_state["pipeline_steps"]),
-                   consensus_reached=final_state["consensus_reached"])
+            logger.info("pipeline_output_saved", 
+                       file="output.json", 
+                       total_steps=len(final_state["pipeline_steps"]),
+                       consensus_reached=final_state["consensus_reached"])
         
-        print(f"\n📊 Generated {len(final_state['pipeline_steps'])} pipeline steps:")
-        print(f"🔄 Debate rounds: {final_state['debate_rounds']}")
-        print(f"✅ Consensus: {'Yes' if final_state['consensus_reached'] else 'No'}")
-        print(f"💾 Results saved to: output.json")
+            print(f"\n📊 Generated {len(final_state['pipeline_steps'])} pipeline steps:")
+            print(f"🔄 Debate rounds: {final_state['debate_rounds']}")
+            print(f"✅ Consensus: {'Yes' if final_state['consensus_reached'] else 'No'}")
+            print(f"💾 Results saved to: output.json")
         
-        print("\n" + "="*80)
-        print("📋 FINAL PIPELINE STEPS:")
-        print("="*80)
+            print("\n" + "="*80)
+            print("📋 FINAL PIPELINE STEPS:")
+            print("="*80)
         
-        for i, step in enumerate(final_state["pipeline_steps"], 1):
-            print(f"\n{i}. **{step.step_name}**")
+            for i, step in enumerate(final_state["pipeline_steps"], 1):
+                print(f"\n{i}. **{step.step_name}**")
             
-            if verbose:
-                # Show full rationale and code in verbose mode
-                print(f"\n   📝 RATIONALE:")
-                print(f"   {step.rationale}")
+                if verbose:
+                    # Show full rationale and code in verbose mode
+                    print(f"\n   📝 RATIONALE:")
+                    print(f"   {step.rationale}")
                 
-                if step.code_snippet.strip():
-                    print(f"\n   💻 CODE:")
-                    # Indent code for better readability
-                    code_lines = step.code_snippet.split('\n')
-                    for line in code_lines:
-                        print(f"   {line}")
+                    if step.code_snippet.strip():
+                        print(f"\n   💻 CODE:")
+                        # Indent code for better readability
+                        code_lines = step.code_snippet.split('\n')
+                        for line in code_lines:
+                            print(f"   {line}")
                 
-                print("\n" + "-"*80)
-            else:
-                # Show summary in normal mode
-                print(f"   Rationale: {step.rationale[:100]}{'...' if len(step.rationale) > 100 else ''}")
-                if step.code_snippet.strip():
-                    print(f"   Code Preview: {step.code_snippet[:80]}{'...' if len(step.code_snippet) > 80 else ''}")
-                print()
-    else:
-        print("❌ No results generated")
+                    print("\n" + "-"*80)
+                else:
+                    # Show summary in normal mode
+                    print(f"   Rationale: {_preview(step.rationale, 100)}")
+                    if step.code_snippet.strip():
+                        print(f"   Code Preview: {_preview(step.code_snippet, 80)}")
+                    print()
+        else:
+            print("❌ No results generated")
+    finally:
+        # Shutdown hooks (also on errors): land background gap-store writes, release the persistent MCP session
+        await flush_gap_writes()
+        await close_mcp_session()
 
 
 if __name__ == "__main__":
@@ -268,31 +292,10 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--task",
-        default="Build ETL pipeline for sales_data.csv",
+        default=DEFAULT_TASK,
         help="Custom task description for the pipeline"
     )
     
     args = parser.parse_args()
     
-    # Update initial state with custom task if provided
-    if args.task != "Build ETL pipeline for sales_data.csv":
-        def setup_initial_state_custom():
-            return {
-                "task": args.task,
-                "refined_prompt": "",
-                "pipeline_steps": [],
-                "debate_rounds": 0,
-                "consensus_reached": False,
-                "discovered_tools": {},
-                "feedback_summary": "",
-                "feedback_history": [],
-                "gap_escalation_count": 0,
-                "current_data_path": "data/sales_data.csv",
-                "data_format": "csv",
-                "pipeline_metadata": {},
-            }
-        
-        # Replace the function globally for this run
-        globals()['setup_initial_state'] = setup_initial_state_custom
-    
-    asyncio.run(main(verbose=args.verbose))
+    asyncio.run(main(verbose=args.verbose, task=args.task))
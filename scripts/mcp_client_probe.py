@@ -7,9 +7,13 @@ async def test_mcp():
     async with streamablehttp_client("http://localhost:8000/mcp") as (read, write, _):
         async with ClientSession(read, write) as session:
             await session.initialize()
-            # List tools (progress check: Should show load_csv, validate_data)
-            tools = await session.list_tools()
-            print("Available Tools:", [t.name for t in tools.tools])
+            # list_tools and validate_data don't depend on the load -> clean -> transform chain:
+            # start them now (requests are multiplexed on the session) and collect them at the end
+            tools_task = asyncio.create_task(session.list_tools())
+            mock_steps = [{"step_name": "test", "code_snippet": "", "rationale": ""}]
+            validate_task = asyncio.create_task(
+                session.call_tool("validate_data", {"steps": mock_steps})
+            )
 
             # Test load_csv (simulate ingestion)
             load_result = await session.call_tool(
@@ -40,11 +44,10 @@ async def test_mcp():
             else:
                 print("❌ Clean result was None, skipping transform test")
 
-            # Test validate_data (simulate validation)
-            mock_steps = [{"step_name": "test", "code_snippet": "", "rationale": ""}]
-            valid_result = await session.call_tool(
-                "validate_data", {"steps": mock_steps}
-            )
+            # List tools (progress check: Should show load_csv, validate_data)
+            # and validate_data (simulate validation), both already in flight
+            tools, valid_result = await asyncio.gather(tools_task, validate_task)
+            print("Available Tools:", [t.name for t in tools.tools])
             print("Validation Result:", valid_result.structuredContent)
 
 
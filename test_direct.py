@@ -2,7 +2,10 @@
 """Direct test without pytest to verify functionality."""
 
 import asyncio
-from unittest.mock import patch, MagicMock
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import patch, MagicMock, DEFAULT
 
 # Test langchain-chroma functionality directly
 def test_chroma_integration():
@@ -13,20 +16,20 @@ def test_chroma_integration():
         from langchain_openai import OpenAIEmbeddings
         import tempfile
         
-        # Create temporary directory for testing
-        temp_dir = tempfile.mkdtemp()
-        print(f"Using temp directory: {temp_dir}")
-        
-        # Test Chroma initialization (no API call needed)
-        embeddings = OpenAIEmbeddings(api_key="dummy-key")
-        vectorstore = Chroma(persist_directory=temp_dir, embedding_function=embeddings)
-        
-        print("✅ Chroma vectorstore created successfully")
-        
-        # Test that vectorstore has expected methods
-        assert hasattr(vectorstore, 'add_texts')
-        assert hasattr(vectorstore, 'as_retriever')
-        print("✅ Chroma has expected methods")
+        # Temporary directory for testing, removed on exit
+        with tempfile.TemporaryDirectory() as temp_dir:
+            print(f"Using temp directory: {temp_dir}")
+            
+            # Test Chroma initialization (no API call needed)
+            embeddings = OpenAIEmbeddings(api_key="dummy-key")
+            vectorstore = Chroma(persist_directory=temp_dir, embedding_function=embeddings)
+            
+            print("✅ Chroma vectorstore created successfully")
+            
+            # Test that vectorstore has expected methods
+            assert hasattr(vectorstore, 'add_texts')
+            assert hasattr(vectorstore, 'as_retriever')
+            print("✅ Chroma has expected methods")
         
         return True
         
@@ -38,17 +41,28 @@ def test_cleaner_functionality():
     print("\n🧪 Testing cleaner functionality...")
     
     try:
+        import tempfile
         from agents.cleaner import build_cleaning_index
+        from agents._rag import _doc_id
         
-        # Mock the vectorstore to avoid API calls
-        with patch('agents.cleaner.vectorstore') as mock_vectorstore:
+        # Mock the vectorstore and retrieval cache to avoid API calls; build sentinels go to a temp dir
+        with tempfile.TemporaryDirectory() as temp_dir, patch.multiple(
+            "agents.cleaner",
+            _vectorstore=DEFAULT,
+            clear_cached_retrieval=DEFAULT,
+            EMBEDDING_INDEX_DIR=Path(temp_dir),
+        ) as mocks:
+            mock_vectorstore = mocks["_vectorstore"].return_value
             mock_vectorstore.add_texts = MagicMock()
             
             # Test build_cleaning_index
             build_cleaning_index(["Test cleaning rule"])
             
-            # Verify it was called
-            mock_vectorstore.add_texts.assert_called_once_with(["Test cleaning rule"])
+            # Verify it was called with content-hash ids
+            mock_vectorstore.add_texts.assert_called_once_with(
+                ["Test cleaning rule"], ids=[_doc_id("Test cleaning rule")]
+            )
+            mocks["clear_cached_retrieval"].assert_called_once_with("cleaning_rules")
             
         print("✅ Cleaner build_cleaning_index works")
         return True
@@ -78,17 +92,20 @@ def test_mcp_tools():
 def main():
     print("🚀 Running direct functionality tests...\n")
     
-    results = []
-    results.append(test_chroma_integration())
-    results.append(test_cleaner_functionality()) 
-    results.append(test_mcp_tools())
+    tests = [test_chroma_integration, test_cleaner_functionality, test_mcp_tools]
+    # Independent (own temp dir / patch scope): overlap their import-bound work
+    with ThreadPoolExecutor(max_workers=len(tests)) as ex:
+        results = list(zip((t.__name__ for t in tests), ex.map(lambda test: test(), tests)))
     
-    print(f"\n📊 Results: {sum(results)}/{len(results)} tests passed")
+    print(f"\n📊 Results: {sum(ok for _, ok in results)}/{len(results)} tests passed")
+    for name, ok in results:
+        print(f"  {'✅' if ok else '❌'} {name}")
     
-    if all(results):
+    if all(ok for _, ok in results):
         print("🎉 All tests passed! The langchain-chroma integration is working correctly.")
-    else:
-        print("⚠️  Some tests failed. Check the error messages above.")
+        return 0
+    print("⚠️  Some tests failed. Check the error messages above.")
+    return 1  # Non-zero exit so a red sub-test fails CI/scripts, not just the printout
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
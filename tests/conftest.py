@@ -0,0 +1,32 @@
+# tests/conftest.py: Shared agent I/O mocks (retrieval, MCP tool call, LLM chain)
+import os
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock, DEFAULT
+import pytest
+
+os.environ["LLM_CACHE"] = "off"  # Before agents import: tests never read or write indexes/llm_cache.sqlite3
+
+
+def _mcp_result() -> AsyncMock:
+    return AsyncMock(return_value=MagicMock(structuredContent={"metadata": {}}))
+
+
+@pytest.fixture
+def cleaner_io():
+    """Patch agents.cleaner's retrieval, MCP call and chain; tests set chain.astream per case."""
+    call_tool = _mcp_result()
+    with patch.multiple("agents.cleaner", _retrieve_sync=DEFAULT, call_mcp_tool=call_tool, _chain=DEFAULT) as mocks:
+        mocks["_retrieve_sync"].return_value = ()
+        yield SimpleNamespace(
+            retrieve=mocks["_retrieve_sync"], call_tool=call_tool, chain=mocks["_chain"].return_value
+        )
+
+
+@pytest.fixture
+def transformer_io():
+    """Patch agents.transformer's retriever, MCP call and chain; tests set chain.ainvoke per case."""
+    call_tool = _mcp_result()
+    with patch.multiple("agents.transformer", _retriever=DEFAULT, call_mcp_tool=call_tool, _chain=DEFAULT) as mocks:
+        retriever = mocks["_retriever"].return_value
+        retriever.ainvoke = AsyncMock(return_value=[])
+        yield SimpleNamespace(retriever=retriever, call_tool=call_tool, chain=mocks["_chain"].return_value)
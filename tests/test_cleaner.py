@@ -1,55 +1,122 @@
 # tests/test_cleaner.py
 import pytest
-from unittest.mock import patch, AsyncMock, MagicMock
-from agents.cleaner import clean_data, build_cleaning_index
+from unittest.mock import patch, MagicMock, DEFAULT
+import pandas as pd
+from agents.cleaner import clean_data, clean_data_stream, build_cleaning_index
+from agents._rag import _doc_id
 from config import PipelineStep
+from tools import data_tools
+
+
+async def _astream(*chunks):
+    for chunk in chunks:
+        yield chunk
 
 
 @pytest.mark.asyncio
-async def test_clean_data():
+async def test_clean_data(cleaner_io):
     """Test clean_data function with proper mocking"""
     mock_step = PipelineStep(step_name="ingest", code_snippet="", rationale="")
-    
-    # Mock the retriever invoke method
-    mock_doc = MagicMock()
-    mock_doc.page_content = "Impute nulls"
-    
-    with patch("agents.cleaner.retriever") as mock_retriever:
-        mock_retriever.invoke.return_value = [mock_doc]
-        
-        # Mock MCP client
-        with patch("agents.cleaner.streamablehttp_client") as mock_client_ctx:
-            with patch("agents.cleaner.ClientSession") as mock_session_cls:
-                mock_session = AsyncMock()
-                mock_session.initialize = AsyncMock()
-                mock_session.call_tool.return_value = AsyncMock(
-                    structuredContent={
-                        "cleaned_json": "[]", 
-                        "metadata": {"size_mb": 0.5}
-                    }
-                )
-                mock_session_cls.return_value.__aenter__.return_value = mock_session
-                mock_client_ctx.return_value.__aenter__.return_value = (None, None, None)
-                
-                # Mock the chain - make ainvoke an async function
-                with patch("agents.cleaner.chain") as mock_chain:
-                    mock_chain.ainvoke = AsyncMock(return_value=PipelineStep(
-                        step_name="clean", 
-                        code_snippet="df.fillna()", 
-                        rationale="Applied cleaning with single-pass processing"
-                    ))
-                    
-                    result = await clean_data("data/test.csv", mock_step)
-                    assert isinstance(result, PipelineStep)
-                    assert result.step_name == "clean"
-                    assert "df.fillna()" in result.code_snippet
-
-
-def test_build_cleaning_index():
+    # Cached retrieval is mocked so nothing is read from or written to the on-disk cache
+    cleaner_io.retrieve.return_value = ("Impute nulls",)
+    cleaner_io.call_tool.return_value = MagicMock(
+        structuredContent={
+            "cleaned_json": "[]", 
+            "metadata": {"size_mb": 0.5}
+        }
+    )
+    # astream yields cumulative partial dicts
+    cleaner_io.chain.astream = lambda inputs: _astream(
+        {"step_name": "clean"},
+        {"step_name": "clean", "code_snippet": "df.fillna()", "rationale": "Applied cleaning with single-pass processing"},
+    )
+
+    result = await clean_data("data/test.csv", mock_step)
+    assert isinstance(result, PipelineStep)
+    assert result.step_name == "clean"
+    assert "df.fillna()" in result.code_snippet
+    cleaner_io.call_tool.assert_awaited_once()
+    cleaner_io.retrieve.assert_called_once_with("Cleaning rules for test.csv")
+
+
+@pytest.mark.asyncio
+async def test_clean_data_mcp_call_reads_dataset_path(cleaner_io, tmp_path):
+    """Test the agent -> clean_data tool path: the ingest step carries no rows, so the tool reads the file"""
+    csv_path = tmp_path / "sales.csv"
+    pd.DataFrame({"qty": [1.0, None, 3.0], "region": ["N", "S", "N"]}).to_csv(csv_path, index=False)
+
+    async def dispatch(name, arguments):
+        _, structured = await data_tools.mcp.call_tool(name, arguments)
+        return MagicMock(structuredContent=structured)
+
+    cleaner_io.call_tool.side_effect = dispatch
+    cleaner_io.chain.astream = lambda inputs: _astream(
+        {"step_name": "clean", "code_snippet": "df.fillna()", "rationale": inputs["ingest_metadata"]}
+    )
+    with patch("agents.cleaner.local_metadata", return_value=None), \
+         patch("tools.data_tools.read_frame", wraps=data_tools.read_frame) as read_frame:
+        result = await clean_data(str(csv_path), PipelineStep(step_name="ingest", code_snippet="", rationale=""))
+
+    read_frame.assert_called_once_with(str(csv_path))
+    assert "'nulls_fixed': 1" in result.rationale
+
+
+@pytest.mark.asyncio
+async def test_clean_data_stream_yields_partials(cleaner_io):
+    """Test that partial fields are surfaced before the full step is emitted"""
+    mock_step = PipelineStep(step_name="ingest", code_snippet="", rationale="")
+    cleaner_io.chain.astream = lambda inputs: _astream(
+        {}, {"output_file_path": "data/cleaned.csv"}, {"output_file_path": "data/cleaned.csv", "step_name": "clean"}
+    )
+
+    partials = [p async for p in clean_data_stream("data/test.csv", mock_step)]
+
+    assert partials[0] == {"output_file_path": "data/cleaned.csv"}
+    assert partials[-1]["step_name"] == "clean"
+
+
+@pytest.mark.asyncio
+async def test_clean_data_fallback_is_vectorized_parquet(cleaner_io):
+    """Test that a parse failure yields the vectorized Parquet fallback step"""
+    mock_step = PipelineStep(step_name="ingest", code_snippet="", rationale="", output_file_path="data/ingested.csv")
+    cleaner_io.chain.astream = lambda inputs: _astream({"step_name": "clean"})  # Missing fields
+
+    result = await clean_data("data/test.csv", mock_step)
+
+    assert result.step_name == "data_cleaning_fallback"
+    assert result.output_format == "parquet"
+    assert "pd.read_csv('data/ingested.csv', engine='pyarrow')" in result.code_snippet
+    assert ".apply(" not in result.code_snippet
+
+
+@pytest.mark.asyncio
+async def test_clean_data_small_file_skips_mcp(cleaner_io, tmp_path):
+    """Test that small local files use the stat-based metadata stub instead of MCP"""
+    dataset = tmp_path / "small.csv"
+    dataset.write_text("a,b\n1,2\n")
+    mock_step = PipelineStep(step_name="ingest", code_snippet="", rationale="")
+    cleaner_io.chain.astream = lambda inputs: _astream(
+        {"step_name": "clean", "code_snippet": "df", "rationale": inputs["cleaning_rules"]}
+    )
+
+    result = await clean_data(str(dataset), mock_step)
+
+    cleaner_io.call_tool.assert_not_awaited()
+    assert "single-pass cleaning" in result.rationale
+
+
+def test_build_cleaning_index(tmp_path):
     """Test build_cleaning_index function"""
-    with patch("agents.cleaner.vectorstore") as mock_vectorstore:
+    with patch.multiple(
+        "agents.cleaner",
+        _vectorstore=DEFAULT,
+        clear_cached_retrieval=DEFAULT,
+        EMBEDDING_INDEX_DIR=tmp_path,  # Keep build sentinels out of indexes/
+    ) as mocks:
+        mock_vectorstore = mocks["_vectorstore"].return_value
         mock_vectorstore.add_texts = MagicMock()
         
         build_cleaning_index(["Test rule"])
         
-        mock_vectorstore.add_texts.assert_called_once_with(["Test rule"])
+        mock_vectorstore.add_texts.assert_called_once_with(["Test rule"], ids=[_doc_id("Test rule")])
+        mocks["clear_cached_retrieval"].assert_called_once_with("cleaning_rules")
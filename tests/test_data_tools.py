@@ -1,18 +1,29 @@
 # tests/test_data_tools.py
 import pytest
 from unittest.mock import patch, MagicMock
-from tools.data_tools import load_csv, mcp
+import pandas as pd
+from tools.data_tools import (
+    clean_data,
+    frame_from_json,
+    frame_to_json,
+    load_csv,
+    mcp,
+    transform_data,
+    validate_data,
+)
+
+
+@pytest.fixture(scope="session")
+def mock_df():
+    # Built once; tests only read from it. A real frame: load_csv serializes its values
+    return pd.DataFrame({"col": ["val"] * 10})
 
 
 @pytest.fixture
-def mock_pd():
-    with patch("tools.data_tools.pd.read_csv") as mock_read:
-        mock_df = MagicMock()
-        mock_df.to_json.return_value = '[{"col": "val"}]'
-        mock_df.__len__.return_value = 10
-        mock_df.columns = ["col"]
-        mock_read.return_value = mock_df
-        yield
+def mock_pd(monkeypatch, mock_df):
+    # Patching stays per test so read_csv is never left mocked for other modules
+    monkeypatch.setattr("tools.data_tools.pd.read_csv", MagicMock(return_value=mock_df))
+    return mock_df
 
 
 def test_load_csv_small_file(mock_pd):
@@ -34,3 +45,117 @@ def test_mcp_tool_registration():
     # Test that MCP server has tools registered
     assert mcp is not None
     # Note: Full MCP testing would require starting server, which we do separately
+
+
+def test_frame_payload_round_trip():
+    """Test the columnar payload round-trips and row-records payloads still parse"""
+    df = pd.DataFrame({"qty": [1, 2], "region": ["EU", "NA"]})
+    payload = frame_to_json(df)
+    assert payload.count('"region"') == 1  # Column names once, not per row
+    pd.testing.assert_frame_equal(frame_from_json(payload), df)
+    pd.testing.assert_frame_equal(frame_from_json(df.to_json(orient="records")), df)
+    assert frame_from_json("").empty
+    missing = pd.DataFrame({"price": [1.5, None]})
+    assert frame_to_json(missing) == '{"columns":["price"],"data":[[1.5],[null]]}'
+    pd.testing.assert_frame_equal(frame_from_json(frame_to_json(missing)), missing)
+
+
+def test_clean_data_imputes_and_drops_outliers(tmp_path):
+    """Test median imputation and >3 std outlier removal on a real CSV"""
+    csv_path = tmp_path / "sales.csv"
+    values = [10.0] * 30 + [1000.0]
+    pd.DataFrame({"qty": values, "price": [None] + values[1:], "region": ["EU"] * 31}).to_csv(csv_path, index=False)
+
+    result = clean_data(str(csv_path), {}, MagicMock())
+
+    assert result.metadata["nulls_fixed"] == 1
+    assert result.metadata["outliers_removed"] == 2  # One row, flagged in both columns
+    cleaned = frame_from_json(result.cleaned_json)
+    assert len(cleaned) == 30 and cleaned["price"].notna().all()
+
+
+def test_load_csv_metadata_only(tmp_path):
+    """Test that include_data=False reports the same shape without serializing rows"""
+    csv_path = tmp_path / "sales.csv"
+    pd.DataFrame({"qty": range(25), "region": ["EU"] * 25}).to_csv(csv_path, index=False)
+
+    full = load_csv(str(csv_path), MagicMock())
+    with patch("tools.data_tools.CSV_CHUNK_ROWS", 10):  # 3 chunks
+        meta_only = load_csv(str(csv_path), MagicMock(), include_data=False)
+
+    assert meta_only.data_json == ""
+    assert meta_only.metadata == full.metadata
+    assert (meta_only.metadata["rows"], meta_only.metadata["columns"]) == (25, 2)
+
+
+def test_transform_data_scales_and_encodes():
+    """Test z-scored numerics (constant columns untouched) and <col>_<value> one-hot columns"""
+    df = pd.DataFrame({"qty": [1, 2, 3, 4], "flat": [7, 7, 7, 7], "region": ["EU", "NA", "EU", "AS"]})
+
+    result = transform_data("unused.csv", {"cleaned_json": frame_to_json(df), "size_mb": 0.1}, MagicMock())
+
+    out = frame_from_json(result.transformed_json)
+    assert list(out.columns) == ["qty", "flat", "region_AS", "region_EU", "region_NA"]
+    assert abs(out["qty"].mean()) < 1e-6 and abs(out["qty"].std(ddof=0) - 1) < 1e-6  # float32 output
+    assert (out["flat"] == 0).all()
+    assert out["region_EU"].tolist() == [1.0, 0.0, 1.0, 0.0]
+    assert result.metadata == {"size_mb": 0.1, "new_features": 2, "scaled_cols": 2}
+
+
+def test_column_fan_out_matches_sequential(tmp_path):
+    """Test that the threaded per-column path gives the same clean/transform output"""
+    csv_path = tmp_path / "sales.csv"
+    values = [10.0] * 30 + [1000.0]
+    pd.DataFrame({"qty": values, "price": values[::-1], "region": ["EU", "NA"] * 15 + ["AS"]}).to_csv(csv_path, index=False)
+
+    results = []
+    for min_rows in (10**9, 0):  # Sequential, then threaded
+        with patch("tools.data_tools.PARALLEL_MIN_ROWS", min_rows):
+            cleaned = clean_data(str(csv_path), {}, MagicMock())
+            results.append((cleaned, transform_data("unused.csv", cleaned.model_dump(), MagicMock())))
+
+    (clean_seq, transform_seq), (clean_par, transform_par) = results
+    assert clean_par == clean_seq and transform_par == transform_seq
+    assert clean_par.metadata["outliers_removed"] == 2
+
+
+def test_parquet_paths_dispatch_to_read_parquet():
+    """Test that .parquet datasets are read with read_parquet"""
+    df = pd.DataFrame({"qty": [1, 2], "region": ["EU", "NA"]})
+    with patch("tools.data_tools.pd.read_parquet", return_value=df) as read_parquet, \
+         patch("tools.data_tools.os.path.getsize", return_value=1024):
+        result = load_csv("data/sales.parquet", MagicMock(), include_data=False)
+
+    read_parquet.assert_called_once_with("data/sales.parquet")
+    assert (result.metadata["rows"], result.metadata["columns"]) == (2, 2)
+
+
+def test_validate_data_checks_payload():
+    """Test null and duplicate-row checks on a data payload"""
+    df = pd.DataFrame({"qty": [1.0, 2.0, None, 1.0], "region": ["EU", None, "NA", "EU"]})
+    steps = [{"step_name": "clean"}]
+
+    result = validate_data(steps, MagicMock(), data_json=frame_to_json(df))
+
+    assert not result.valid
+    assert result.issues == [
+        "Column 'qty' has 1 null values",
+        "Column 'region' has 1 null values",
+        "Dataset has 1 duplicate rows",
+    ]
+    assert validate_data(steps, MagicMock(), data_json=frame_to_json(df.dropna()[:0])).issues == ["Dataset has no rows"]
+    assert validate_data(steps, MagicMock()).valid
+
+
+def test_clean_data_reuses_loaded_rows(tmp_path):
+    """Test that clean_data cleans the load_csv payload instead of re-reading the file"""
+    csv_path = tmp_path / "sales.csv"
+    pd.DataFrame({"qty": [1.0, None, 3.0]}).to_csv(csv_path, index=False)
+    loaded = load_csv(str(csv_path), MagicMock())
+
+    with patch("tools.data_tools.read_frame") as read_frame:
+        result = clean_data(str(csv_path), loaded.model_dump(), MagicMock())
+
+    read_frame.assert_not_called()
+    assert result.metadata["nulls_fixed"] == 1
+    assert frame_from_json(result.cleaned_json)["qty"].tolist() == [1.0, 2.0, 3.0]
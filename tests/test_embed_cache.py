@@ -0,0 +1,36 @@
+# tests/test_embed_cache.py
+from unittest.mock import MagicMock, patch
+import agents._embed_cache as embed_cache
+
+
+def setup_function():
+    embed_cache.clear_embedding_cache()
+
+
+def test_repeat_query_hits_cache():
+    """Test that an identical query is embedded only once"""
+    embed = MagicMock(return_value=[0.1, 0.2])
+
+    assert embed_cache.cached_embed_query("Cleaning rules for a.csv", embed) == [0.1, 0.2]
+    assert embed_cache.cached_embed_query("Cleaning rules for a.csv", embed) == [0.1, 0.2]
+    embed.assert_called_once_with("Cleaning rules for a.csv")
+
+
+def test_stale_entry_is_reembedded():
+    """Test that entries older than the TTL are refreshed"""
+    embed = MagicMock(return_value=[1.0])
+    with patch("agents._embed_cache.time.monotonic", side_effect=[0.0, embed_cache.TTL_SECONDS + 1, 0.0]):
+        embed_cache.cached_embed_query("q", embed)
+        embed_cache.cached_embed_query("q", embed)
+    assert embed.call_count == 2
+
+
+def test_lru_eviction():
+    """Test that the least recently used entry is evicted past MAX_ENTRIES"""
+    embed = MagicMock(side_effect=lambda text: [float(len(text))])
+    with patch("agents._embed_cache.MAX_ENTRIES", 2):
+        for query in ("a", "bb", "a", "ccc"):
+            embed_cache.cached_embed_query(query, embed)
+        embed_cache.cached_embed_query("a", embed)
+        embed_cache.cached_embed_query("bb", embed)
+    assert [c.args[0] for c in embed.call_args_list] == ["a", "bb", "ccc", "bb"]
@@ -0,0 +1,103 @@
+# tests/test_gap_resolver.py
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+from langchain_core.documents import Document
+from agents.gap_resolver import (
+    GAP_TEMPLATES,
+    MULTI_GAP_CHAIN,
+    GapResolutions,
+    SINGLE_GAP_CHAIN,
+    extract_top_gaps,
+    flush_gap_writes,
+    multi_gap_resolver_swarmlet,
+    resolve_persistent_gaps,
+    single_gap_fallback,
+)
+from config import PipelineStep
+
+CACHED_STEP = PipelineStep(step_name="cached", code_snippet="load()", rationale="from cache")
+
+
+@pytest.mark.asyncio
+async def test_near_duplicate_gaps_hit_semantic_cache():
+    """Test that a close match returns the stored step without re-resolving"""
+    hit = Document(page_content="missing load", metadata={"step": CACHED_STEP.model_dump_json()})
+    mock_store = MagicMock()
+    with patch("agents.gap_resolver._get_gap_store", return_value=mock_store):
+        mock_store.asimilarity_search_with_score = AsyncMock(return_value=[(hit, 0.03)])
+        with patch("agents.gap_resolver._resolve_gaps", new_callable=AsyncMock) as mock_resolve:
+            result = await resolve_persistent_gaps("missing load step", "ctx", [])
+
+    assert result == CACHED_STEP
+    mock_resolve.assert_not_awaited()
+    mock_store.aadd_texts.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_distant_gaps_resolve_and_store_step():
+    """Test that a miss resolves the gaps and stores the step alongside them"""
+    far = Document(page_content="no monitoring", metadata={"step": CACHED_STEP.model_dump_json()})
+    fresh = PipelineStep(step_name="fresh", code_snippet="test()", rationale="new")
+    mock_store = MagicMock()
+    with patch("agents.gap_resolver._get_gap_store", return_value=mock_store):
+        mock_store.asimilarity_search_with_score = AsyncMock(return_value=[(far, 0.4)])
+        mock_store.aadd_texts = AsyncMock()
+        with patch("agents.gap_resolver._resolve_gaps", new_callable=AsyncMock, return_value=fresh):
+            result = await resolve_persistent_gaps("missing tests", "ctx", [])
+            await flush_gap_writes()  # Background store
+
+    assert result == fresh
+    texts, = mock_store.aadd_texts.call_args.args
+    assert texts == ["missing tests"]
+    assert mock_store.aadd_texts.call_args.kwargs["metadatas"][0]["step"] == fresh.model_dump_json()
+
+
+def test_extract_top_gaps_counts_keywords():
+    """Test keyword frequency ranking over rationales"""
+    rationales = ["Missing load to BigQuery; add monitoring", "No monitoring or logging", "monitoring gaps"]
+    assert extract_top_gaps(rationales, top_n=2) == ["monitoring", "load"]
+    assert extract_top_gaps(["nothing relevant"]) == ["load", "monitoring", "testing"]
+
+
+@pytest.mark.asyncio
+async def test_single_gap_fallback_selects_triggered_templates():
+    """Test that trigger tokens pick the matching templates for the prompt context"""
+    with patch("agents.gap_resolver.limited_ainvoke", new_callable=AsyncMock, return_value=CACHED_STEP) as mock_invoke:
+        await single_gap_fallback("Missing load step; data quality checks", "ctx", [])
+
+    context = mock_invoke.call_args.args[1]["context"]
+    assert GAP_TEMPLATES["load"] in context
+    assert GAP_TEMPLATES["validation"] in context
+    assert GAP_TEMPLATES["monitoring"] not in context
+
+
+@pytest.mark.asyncio
+async def test_swarmlet_resolves_all_gaps_in_one_call():
+    """Test that the top gaps go to the model in a single batched request"""
+    history = ["rationale: missing load", "rationale: no monitoring"]
+    batch = GapResolutions(steps=[CACHED_STEP, CACHED_STEP])
+    with patch("agents.gap_resolver.limited_ainvoke", new_callable=AsyncMock, return_value=batch) as mock_invoke:
+        steps = await multi_gap_resolver_swarmlet("gaps", "ctx {with braces}", history)
+
+    assert steps == [CACHED_STEP, CACHED_STEP]
+    mock_invoke.assert_awaited_once()
+    chain, inputs = mock_invoke.call_args.args
+    assert chain is MULTI_GAP_CHAIN
+    assert inputs["context"] == "ctx {with braces}"
+    assert "Gap: load" in inputs["gap_sections"] and "Gap: monitoring" in inputs["gap_sections"]
+    assert "{{" not in inputs["gap_sections"]
+
+
+@pytest.mark.asyncio
+async def test_swarmlet_falls_back_to_single_gap_chain():
+    """Test that a failed batch resolves each gap through the shared per-gap chain"""
+    history = ["rationale: missing load", "rationale: no monitoring"]
+    with patch("agents.gap_resolver.limited_ainvoke", new_callable=AsyncMock,
+               side_effect=[ValueError("bad batch"), CACHED_STEP, CACHED_STEP]) as mock_invoke:
+        steps = await multi_gap_resolver_swarmlet("gaps", "ctx", history)
+
+    assert len(steps) == 2  # One per keyword found (load, monitoring)
+    for call in mock_invoke.call_args_list[1:]:
+        chain, inputs = call.args
+        assert chain is SINGLE_GAP_CHAIN
+        assert "{{" not in inputs["template"]
@@ -1,43 +1,211 @@
 # tests/test_graph.py
+import time
+from contextlib import ExitStack
 import pytest
-from unittest.mock import patch, AsyncMock
-from graph import app
+from unittest.mock import patch, AsyncMock, MagicMock
+from langgraph.graph import END
+from graph import (
+    DISCOVERY_TTL_SECONDS,
+    FEEDBACK_HISTORY_LEN,
+    app,
+    calculate_semantic_similarity,
+    debate_node,
+    discovery_node,
+    route,
+)
 from config import PipelineStep
 
 
+def _step(name: str, **fields) -> PipelineStep:
+    return PipelineStep(step_name=name, code_snippet="", rationale=name, **fields)
+
+
 @pytest.mark.asyncio
 async def test_graph_workflow():
-    with patch(
-        "graph.discovery_node",
-        return_value={"discovered_tools": {"ingest": "load_csv"}},
-    ):
-        with patch(
-            "graph.prompt_node",
-            return_value={
-                "refined_prompt": "Mock refine",
-                "pipeline_steps": [PipelineStep(step_name="test", code_snippet="", rationale="test")],
-            },
-        ):
-            with patch(
-                "graph.ingest_node",
-                return_value={"pipeline_steps": [PipelineStep(...)]},
-            ):
-                with patch(
-                    "graph.clean_node",
-                    return_value={"pipeline_steps": [PipelineStep(...)]},
-                ):
-                    with patch(
-                        "graph.transform_node",
-                        return_value={"pipeline_steps": [PipelineStep(...)]},
-                    ):
-                        with patch(
-                            "graph.debate_node",
-                            return_value={
-                                "consensus_reached": True,
-                                "pipeline_steps": [PipelineStep(step_name="test", code_snippet="", rationale="test")],
-                            },
-                        ):
-                            initial = {"task": "test", "pipeline_steps": []}
-                            result = await app.ainvoke(initial)
-                            assert len(result["pipeline_steps"]) > 0
-                            assert result["consensus_reached"]
+    """Test one pass through the compiled graph with every agent call mocked"""
+    from main import setup_initial_state
+
+    agent_calls = {
+        "graph.list_mcp_tools": {"load_csv": "Load"},
+        "graph.refine_prompt": _step("refined_prompt"),
+        "graph.ingest_data": _step("data_ingestion", output_file_path="data/ingested.parquet", output_format="parquet"),
+        "graph.clean_data": _step("data_cleaning"),
+        "graph.transform_data": _step("data_transformation"),
+        "graph.validate_steps": (_step("validation"), [{"vote": "Yes", "rationale": "Yes, valid"}]),
+    }
+    with ExitStack() as stack:
+        stack.enter_context(patch("graph._DISCOVERY_CACHE", None))
+        mocks = {
+            target: stack.enter_context(patch(target, new_callable=AsyncMock, return_value=return_value))
+            for target, return_value in agent_calls.items()
+        }
+        result = await app.ainvoke(setup_initial_state("test"))
+
+    assert [step.step_name for step in result["pipeline_steps"]] == [
+        "refined_prompt", "data_ingestion", "data_cleaning", "data_transformation", "validation",
+    ]
+    assert result["consensus_reached"]
+    assert result["discovered_tools"] == {"ingest": "load_csv"}
+    # Each stage reads the previous stage's output
+    assert mocks["graph.clean_data"].await_args.args[0] == "data/ingested.parquet"
+
+
+def test_semantic_similarity_is_keyword_jaccard():
+    """Test Jaccard overlap of key terms across gap sets"""
+    gaps1 = {"Missing validation step", " data quality checks"}
+    gaps2 = {"missing validation", "error handling absent"}
+    # {validation, missing, data, quality} vs {validation, missing, error, handling}
+    assert calculate_semantic_similarity(gaps1, gaps2) == 2 / 6
+    assert calculate_semantic_similarity({"nothing"}, gaps2) == 0.0
+    assert calculate_semantic_similarity(gaps1, gaps1) == 1.0
+
+
+@pytest.mark.asyncio
+async def test_debate_node_counts_votes_and_extracts_gaps():
+    """Test majority detection and gap-sentence extraction from No votes"""
+    votes = [
+        {"vote": "Yes", "rationale": "Yes. Looks good"},
+        {"vote": "No", "rationale": "Missing validation. Good naming. Needs retry logic"},
+        {"vote": "No", "rationale": "Unnecessary steps. Requirements unclear"},
+    ]
+    step = PipelineStep(step_name="validation", code_snippet="", rationale="")
+    state = {
+        "task": "t", "refined_prompt": "p", "pipeline_steps": [], "debate_rounds": 0,
+        "feedback_history": [], "gap_escalation_count": 0,
+    }
+    with patch("graph.validate_steps", new_callable=AsyncMock, return_value=(step, votes)):
+        state = await debate_node(state)
+
+    assert state["consensus_reached"] is False
+    gaps = set(state["feedback_summary"].removeprefix("MUST address these gaps: ").split("; "))
+    assert gaps == {"missing validation", "needs retry logic"}
+
+
+@pytest.mark.asyncio
+async def test_debate_node_reuses_votes_for_unchanged_round():
+    """Test that a round reproducing the previous round's output skips re-voting"""
+    votes = [{"vote": "No", "rationale": "Missing tests"}]
+    verdict = PipelineStep(step_name="validation", code_snippet="Refine pipeline", rationale="0/1")
+    work = PipelineStep(step_name="ingest", code_snippet="load()", rationale="r")
+    state = {
+        "task": "t", "refined_prompt": "p", "pipeline_steps": [work], "debate_rounds": 0,
+        "feedback_history": [], "gap_escalation_count": 2,  # Escalation budget spent
+    }
+    with patch("graph.validate_steps", new_callable=AsyncMock, return_value=(verdict, votes)) as mock_validate:
+        state = await debate_node(state)
+        state["pipeline_steps"].append(work)  # Next round regenerates identical output
+        state = await debate_node(state)
+        assert mock_validate.await_count == 1
+
+        state["pipeline_steps"].append(work.model_copy(update={"code_snippet": "load(); test()"}))
+        state = await debate_node(state)
+        assert mock_validate.await_count == 2
+
+    assert state["pipeline_steps"][-1] == verdict
+
+
+@pytest.mark.asyncio
+async def test_debate_node_redebate_always_revotes():
+    """Test that consecutive re-debates (no new work steps) never replay the stored votes"""
+    votes = [{"vote": "No", "rationale": "Not convinced"}]
+    work = PipelineStep(step_name="ingest", code_snippet="load()", rationale="r")
+    verdicts = [PipelineStep(step_name="validation", code_snippet="Refine pipeline", rationale=str(i)) for i in range(3)]
+    state = {
+        "task": "t", "refined_prompt": "p", "pipeline_steps": [work], "debate_rounds": 0,
+        "feedback_history": [], "gap_escalation_count": 2,
+    }
+    with patch("graph.validate_steps", new_callable=AsyncMock, side_effect=[(v, votes) for v in verdicts]) as mock_validate:
+        for _ in verdicts:
+            state = await debate_node(state)
+            assert state["feedback_summary"] == ""  # No gaps: route() sends it back to debate
+
+    assert mock_validate.await_count == 3
+    assert state["pipeline_steps"] == [work, *verdicts]
+
+
+def test_discovery_and_prompt_run_as_parallel_branches():
+    """Test that discovery and prompt both start the graph and feed ingest"""
+    edges = {(edge.source, edge.target) for edge in app.get_graph().edges}
+    assert {("__start__", "discovery"), ("__start__", "prompt")} <= edges
+    assert {("discovery", "ingest"), ("prompt", "ingest")} <= edges
+    assert ("discovery", "prompt") not in edges
+
+
+@pytest.mark.asyncio
+async def test_persistent_gaps_escalate_to_resolver():
+    """Test that overlapping gaps across rounds (compared via stored masks) trigger the resolver"""
+    resolver = PipelineStep(step_name="resolver", code_snippet="fix()", rationale="r")
+    verdict = MagicMock(consensus_reached=False, vote_count="0/1", rationale="still missing")
+    state = {
+        "task": "t", "refined_prompt": "p", "pipeline_steps": [], "debate_rounds": 0,
+        "feedback_history": [], "feedback_masks": [], "gap_escalation_count": 0,
+    }
+    with patch("graph.resolve_persistent_gaps", new_callable=AsyncMock, return_value=resolver) as mock_resolve, \
+         patch("agents.validator.validate_pipeline", new_callable=AsyncMock, return_value=verdict):
+        for i in range(3):
+            votes = [{"vote": "No", "rationale": f"Missing data validation in step {i}"}]
+            step = PipelineStep(step_name="validation", code_snippet="", rationale=str(i))
+            with patch("graph.validate_steps", new_callable=AsyncMock, return_value=(step, votes)):
+                state = await debate_node(state)
+
+    mock_resolve.assert_awaited_once()
+    assert len(state["feedback_masks"]) == len(state["feedback_history"]) == 3
+    assert state["gap_escalation_count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_discovery_reuses_tool_listing_within_ttl():
+    """Test that tool discovery hits MCP once per TTL window"""
+    tools = {"load_csv": "Load", "clean_data": "Clean"}
+    with patch("graph._DISCOVERY_CACHE", None), \
+         patch("graph.list_mcp_tools", new_callable=AsyncMock, return_value=tools) as mock_list:
+        first = await discovery_node({"discovered_tools": {}})
+        second = await discovery_node({"discovered_tools": {}})
+        assert mock_list.await_count == 1
+
+        with patch("graph.time.monotonic", return_value=time.monotonic() + DISCOVERY_TTL_SECONDS + 1):
+            await discovery_node({"discovered_tools": {}})
+        assert mock_list.await_count == 2
+
+    assert first == second == {"discovered_tools": {"ingest": "load_csv", "clean": "clean_data"}}
+
+
+@pytest.mark.asyncio
+async def test_discovery_falls_back_to_default_tools():
+    """Test that a server without any known tool maps every role to its placeholder"""
+    with patch("graph._DISCOVERY_CACHE", None), \
+         patch("graph.list_mcp_tools", new_callable=AsyncMock, return_value={"other_tool": "Other"}):
+        result = await discovery_node({"discovered_tools": {}})
+
+    assert result["discovered_tools"] == {
+        "ingest": "default_load",
+        "clean": "default_clean",
+        "transform": "default_transform",
+        "validate": "default_validate",
+    }
+
+
+@pytest.mark.asyncio
+async def test_feedback_history_is_bounded():
+    """Test that feedback history and masks keep only the last FEEDBACK_HISTORY_LEN rounds"""
+    state = {
+        "task": "t", "refined_prompt": "p", "pipeline_steps": [], "debate_rounds": 0,
+        "feedback_history": [], "feedback_masks": [], "gap_escalation_count": 2,
+    }
+    for i in range(FEEDBACK_HISTORY_LEN + 2):
+        votes = [{"vote": "No", "rationale": f"Missing data validation in step {i}"}]
+        step = PipelineStep(step_name="validation", code_snippet="", rationale=str(i))
+        state["last_votes"] = {}  # Fresh votes every round
+        with patch("graph.validate_steps", new_callable=AsyncMock, return_value=(step, votes)):
+            state = await debate_node(state)
+
+    assert len(state["feedback_history"]) == len(state["feedback_masks"]) == FEEDBACK_HISTORY_LEN
+    assert state["feedback_history"][-1] == f"missing data validation in step {FEEDBACK_HISTORY_LEN + 1}"
+
+
+def test_route_skips_stage_reruns_without_feedback():
+    """Test that a failed round with no gaps re-debates directly instead of rebuilding stages"""
+    state = {"consensus_reached": False, "debate_rounds": 1, "feedback_summary": ""}
+    assert route(state) == "debate"
+    assert route({**state, "feedback_summary": "MUST address these gaps: missing schema"}) == "prompt"
+    assert route({**state, "consensus_reached": True}) == END
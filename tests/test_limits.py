@@ -0,0 +1,60 @@
+# tests/test_limits.py
+import asyncio
+import httpx
+import openai
+import pytest
+import tenacity
+from unittest.mock import AsyncMock, MagicMock
+from unittest.mock import patch
+from agents._limits import PROVIDER_OF, bounded_invoke, limited_ainvoke
+
+
+def _rate_limit_error():
+    response = httpx.Response(429, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+@pytest.mark.asyncio
+async def test_limited_ainvoke_retries_rate_limit():
+    """Test that a 429 is retried and the eventual result returned"""
+    chain = MagicMock()
+    chain.ainvoke = AsyncMock(side_effect=[_rate_limit_error(), "ok"])
+
+    result = await limited_ainvoke.retry_with(wait=tenacity.wait_none())(chain, {"q": 1})
+
+    assert result == "ok"
+    assert chain.ainvoke.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_limited_ainvoke_does_not_retry_other_errors():
+    """Test that non-rate-limit errors surface immediately"""
+    chain = MagicMock()
+    chain.ainvoke = AsyncMock(side_effect=ValueError("bad output"))
+
+    with pytest.raises(ValueError):
+        await limited_ainvoke(chain, {"q": 1})
+    assert chain.ainvoke.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_bounded_invoke_caps_in_flight_per_provider():
+    """Test that calls for one provider never exceed its semaphore"""
+    in_flight = peak = 0
+
+    async def slow(inputs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return inputs
+
+    chain = MagicMock()
+    chain.ainvoke = slow
+    provider = PROVIDER_OF["validator"]
+    with patch.dict("agents._limits.PROVIDER_SEMAPHORES", {provider: asyncio.Semaphore(2)}):
+        results = await asyncio.gather(*[bounded_invoke("validator", chain, {"q": i}) for i in range(6)])
+
+    assert [r["q"] for r in results] == list(range(6))
+    assert peak == 2
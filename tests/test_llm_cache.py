@@ -0,0 +1,31 @@
+# tests/test_llm_cache.py
+from unittest.mock import patch
+from langchain_core.globals import get_llm_cache
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+from agents._llm_cache import SQLiteLLMCache, with_llm_cache
+
+
+def test_sqlite_llm_cache_roundtrip(tmp_path):
+    """Test that cached generations survive a new cache instance (i.e. a new process)"""
+    SQLiteLLMCache(tmp_path / "llm.sqlite3").update("prompt", "gpt-4o", [ChatGeneration(message=AIMessage(content="hi"))])
+
+    cache = SQLiteLLMCache(tmp_path / "llm.sqlite3")
+    assert [g.text for g in cache.lookup("prompt", "gpt-4o")] == ["hi"]
+    assert cache.lookup("prompt", "grok-3") is None
+
+    cache.clear()
+    assert cache.lookup("prompt", "gpt-4o") is None
+
+
+def test_with_llm_cache_attaches_to_one_model(tmp_path):
+    """Test that the cache rides on a model copy and is never installed process-wide"""
+    cache = SQLiteLLMCache(tmp_path / "llm.sqlite3")
+    model = FakeListChatModel(responses=["hi"])
+    with patch("agents._llm_cache._shared_cache", return_value=cache):
+        cached = with_llm_cache(model)
+
+    assert cached.cache is cache and model.cache is None
+    assert get_llm_cache() is None
+    assert with_llm_cache(None) is None
@@ -0,0 +1,109 @@
+# tests/test_mcp_session.py
+import pytest
+from contextlib import asynccontextmanager
+from unittest.mock import patch, AsyncMock, MagicMock
+import agents._mcp as mcp_session
+
+
+def _fake_transport(sessions, client_kwargs=None):
+    """Patch targets that hand out a fresh mock session per connection."""
+
+    @asynccontextmanager
+    async def fake_client(url, **kwargs):
+        if client_kwargs is not None:
+            client_kwargs.append(kwargs)
+        yield (None, None, None)
+
+    def fake_session_cls(read, write):
+        session = AsyncMock()
+        session.call_tool.return_value = MagicMock(structuredContent={"metadata": {}})
+        sessions.append(session)
+
+        @asynccontextmanager
+        async def cm():
+            yield session
+
+        return cm()
+
+    return fake_client, fake_session_cls
+
+
+@pytest.mark.asyncio
+async def test_session_reused_across_calls():
+    """Test that only one session is initialized for repeated tool calls"""
+    sessions, client_kwargs = [], []
+    fake_client, fake_session_cls = _fake_transport(sessions, client_kwargs)
+    with patch("agents._mcp.streamablehttp_client", fake_client):
+        with patch("agents._mcp.ClientSession", fake_session_cls):
+            await mcp_session.call_mcp_tool("load_csv", {"file_path": "a.csv"})
+            await mcp_session.call_mcp_tool("clean_data", {"file_path": "a.csv"})
+            await mcp_session.close_mcp_session()
+
+    assert len(sessions) == 1
+    sessions[0].initialize.assert_awaited_once()
+    assert sessions[0].call_tool.await_count == 2
+    assert client_kwargs == [{"httpx_client_factory": mcp_session._pooled_http_client}]
+
+
+@pytest.mark.asyncio
+async def test_pooled_http_client_keeps_connections_alive():
+    """Test that the transport's httpx client uses the keep-alive pool limits"""
+    async with mcp_session._pooled_http_client() as client:
+        pool = client._transport._pool
+        assert pool._max_connections == 50
+        assert pool._max_keepalive_connections == 20
+        assert pool._keepalive_expiry == 60.0
+        assert client.headers["Connection"] == "keep-alive"
+
+
+@pytest.mark.asyncio
+async def test_reconnect_on_broken_session():
+    """Test that a failing session is replaced and the call retried once"""
+    sessions = []
+    fake_client, fake_session_cls = _fake_transport(sessions)
+    with patch("agents._mcp.streamablehttp_client", fake_client):
+        with patch("agents._mcp.ClientSession", fake_session_cls):
+            session = await mcp_session.get_mcp_session()
+            session.call_tool.side_effect = ConnectionError("stream closed")
+            result = await mcp_session.call_mcp_tool("load_csv", {"file_path": "a.csv"})
+            await mcp_session.close_mcp_session()
+
+    assert len(sessions) == 2
+    assert result.structuredContent == {"metadata": {}}
+
+
+@pytest.mark.asyncio
+async def test_tool_error_keeps_session_and_is_not_retried():
+    """Test that a non-transport failure propagates without reconnecting or re-running the call"""
+    sessions = []
+    fake_client, fake_session_cls = _fake_transport(sessions)
+    with patch("agents._mcp.streamablehttp_client", fake_client):
+        with patch("agents._mcp.ClientSession", fake_session_cls):
+            session = await mcp_session.get_mcp_session()
+            session.call_tool.side_effect = ValueError("Unknown tool: load_json")
+            with pytest.raises(ValueError):
+                await mcp_session.call_mcp_tool("load_json", {})
+            assert await mcp_session.get_mcp_session() is session
+            await mcp_session.close_mcp_session()
+
+    assert len(sessions) == 1
+    session.call_tool.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_list_tools_shares_session_with_tool_calls():
+    """Test that discovery and tool calls reuse one initialized session"""
+    sessions = []
+    fake_client, fake_session_cls = _fake_transport(sessions)
+    with patch("agents._mcp.streamablehttp_client", fake_client):
+        with patch("agents._mcp.ClientSession", fake_session_cls):
+            session = await mcp_session.get_mcp_session()
+            tool = MagicMock(description="Load a CSV")
+            tool.name = "load_csv"
+            session.list_tools.return_value = MagicMock(tools=[tool])
+            tools = await mcp_session.list_mcp_tools()
+            await mcp_session.call_mcp_tool("load_csv", {"file_path": "a.csv"})
+            await mcp_session.close_mcp_session()
+
+    assert tools == {"load_csv": "Load a CSV"}
+    assert len(sessions) == 1
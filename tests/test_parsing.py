@@ -0,0 +1,20 @@
+# tests/test_parsing.py
+from langchain_core.outputs import Generation
+from agents._parsing import FastPydanticOutputParser
+from config import PipelineStep
+
+parser = FastPydanticOutputParser(pydantic_object=PipelineStep)
+
+
+def test_parses_bare_json():
+    """Test the direct model_validate_json path"""
+    text = '{"step_name": "clean", "code_snippet": "df = df.dropna()\\nprint(df)", "rationale": "nulls"}'
+    step = parser.parse(text)
+    assert isinstance(step, PipelineStep)
+    assert step.code_snippet == "df = df.dropna()\nprint(df)"
+
+
+def test_falls_back_for_fenced_json():
+    """Test that markdown-fenced output still parses via the stock path"""
+    text = '```json\n{"step_name": "clean", "code_snippet": "x", "rationale": "y"}\n```'
+    assert parser.parse_result([Generation(text=text)]).step_name == "clean"
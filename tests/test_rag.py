@@ -0,0 +1,98 @@
+# tests/test_rag.py
+from langchain_core.embeddings import Embeddings
+from unittest.mock import patch
+from agents._rag import FaissVectorStore, add_texts_once, embed_stale_seed_docs, get_retriever, get_vectorstore, prewarm
+
+
+class KeywordEmbeddings(Embeddings):
+    """Deterministic 3-d embeddings: one axis per keyword."""
+
+    terms = ("null", "outlier", "schema")
+
+    def embed_query(self, text):
+        return [float(term in text.lower()) + 1e-3 for term in self.terms]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+def test_faiss_store_returns_nearest_text(tmp_path):
+    """Test FAISS store add + retrieve through the LangChain retriever API"""
+    store = FaissVectorStore(persist_directory=str(tmp_path), embedding_function=KeywordEmbeddings())
+    store.add_texts(["Impute nulls with median", "Remove outliers >3SD"])
+
+    docs = store.as_retriever(search_kwargs={"k": 1}).invoke("How to handle outlier rows?")
+    assert [d.page_content for d in docs] == ["Remove outliers >3SD"]
+
+
+def test_faiss_store_persists_and_reloads(tmp_path):
+    """Test that index + docs are reloaded from persist_directory"""
+    FaissVectorStore(persist_directory=str(tmp_path), embedding_function=KeywordEmbeddings()).add_texts(
+        ["Sales schema: id:int"]
+    )
+
+    reloaded = FaissVectorStore(persist_directory=str(tmp_path), embedding_function=KeywordEmbeddings())
+    assert [d.page_content for d in reloaded.similarity_search("schema", k=3)] == ["Sales schema: id:int"]
+
+
+def test_faiss_store_empty_index(tmp_path):
+    """Test that an unbuilt index yields no documents"""
+    store = FaissVectorStore(persist_directory=str(tmp_path), embedding_function=KeywordEmbeddings())
+    assert store.similarity_search("anything") == []
+
+
+def test_add_texts_once_skips_unchanged_docs(tmp_path):
+    """Test that re-indexing identical seed docs is skipped, and changed docs are indexed"""
+    store = FaissVectorStore(persist_directory=str(tmp_path), embedding_function=KeywordEmbeddings())
+    docs = ["Impute nulls with median", "Remove outliers >3SD"]
+
+    assert add_texts_once(store, docs, str(tmp_path)) is True
+    assert add_texts_once(store, docs, str(tmp_path)) is False
+    assert len(store) == 2
+
+    assert add_texts_once(store, ["Sales schema: id:int"], str(tmp_path)) is True
+    assert len(store) == 3
+
+
+def test_add_texts_once_appends_only_new_faiss_docs(tmp_path):
+    """Test that a grown seed list adds just the new docs, so retrieval returns no duplicates"""
+    store = FaissVectorStore(persist_directory=str(tmp_path), embedding_function=KeywordEmbeddings())
+    add_texts_once(store, ["Impute nulls with median", "Remove outliers >3SD"], str(tmp_path))
+
+    grown = ["Impute nulls with median", "Remove outliers >3SD", "Sales schema: id:int"]
+    assert add_texts_once(store, grown, str(tmp_path), vectors=KeywordEmbeddings().embed_documents(grown)) is True
+    assert len(store) == 3
+    assert sorted(d.page_content for d in store.similarity_search("nulls", k=3)) == sorted(grown)
+
+
+def test_retriever_singleton_shared():
+    """Test that named stores/retrievers are built once and share one embedder"""
+    assert get_retriever("cleaning_rules", 3) is get_retriever("cleaning_rules", 3)
+    assert get_retriever("cleaning_rules", 3).vectorstore is get_vectorstore("cleaning_rules")
+    assert get_vectorstore("cleaning_rules").embeddings is get_vectorstore("schemas").embeddings
+
+
+def test_prewarm_loads_embedder_in_background():
+    """Test that prewarm runs a warmup embed off-thread and can be disabled"""
+    with patch("agents._rag._shared_embeddings.embed_query") as mock_embed:
+        prewarm("cleaning_rules").join(timeout=5)
+        mock_embed.assert_called_once_with("warmup")
+
+        with patch.dict("os.environ", {"RAG_PREWARM": "0"}):
+            assert prewarm("cleaning_rules") is None
+
+
+def test_embed_stale_seed_docs_batches_one_call(tmp_path):
+    """Test that stale seed docs for several indexes are embedded in one call and split back"""
+    stores = {name: FaissVectorStore(persist_directory=str(tmp_path / name), embedding_function=KeywordEmbeddings())
+              for name in ("schemas", "cleaning_rules")}
+    seeds = {"schemas": ["Sales schema: id:int"], "cleaning_rules": ["Impute nulls", "Remove outliers"]}
+    with patch("agents._rag.EMBEDDING_INDEX_DIR", tmp_path), \
+         patch("agents._rag.get_vectorstore", side_effect=stores.get), \
+         patch("agents._rag._shared_embeddings.embed_documents", side_effect=KeywordEmbeddings().embed_documents) as mock_embed:
+        vectors = embed_stale_seed_docs(seeds)
+        mock_embed.assert_called_once_with(["Sales schema: id:int", "Impute nulls", "Remove outliers"])
+        assert [len(vectors[name]) for name in seeds] == [1, 2]
+
+        add_texts_once(stores["schemas"], seeds["schemas"], str(tmp_path / "schemas"), vectors["schemas"])
+        assert list(embed_stale_seed_docs(seeds)) == ["cleaning_rules"]  # Built index drops out
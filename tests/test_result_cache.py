@@ -0,0 +1,30 @@
+# tests/test_result_cache.py
+import pytest
+from unittest.mock import AsyncMock
+from agents._result_cache import ResultCache, result_key
+
+
+@pytest.mark.asyncio
+async def test_same_key_hits_cache():
+    """Test that a repeated key skips compute and a different key misses"""
+    cache = ResultCache()
+    compute = AsyncMock(side_effect=["a", "b"])
+    key = result_key("validator", "task", '[{"step_name": "ingest"}]')
+
+    assert await cache.aget_or_compute(key, compute) == "a"
+    assert await cache.aget_or_compute(key, compute) == "a"
+    assert await cache.aget_or_compute(result_key("validator", "task", "[]"), compute) == "b"
+    assert compute.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_drops_oldest_entry():
+    """Test that the cache stays bounded and forgets least-recently-used entries"""
+    cache = ResultCache(max_entries=2)
+    compute = AsyncMock(side_effect=["a", "b", "c", "a2"])
+
+    for key in ("ingest", "clean", "transform"):
+        await cache.aget_or_compute(key, compute)
+
+    assert len(cache._entries) == 2
+    assert await cache.aget_or_compute("ingest", compute) == "a2"  # Evicted -> recomputed
@@ -55,3 +55,20 @@ async def test_main_app_runs():
     assert "data_cleaning" in step_names
     assert "data_transformation" in step_names
 
+
+
+@pytest.mark.asyncio
+async def test_main_runs_shutdown_hooks_on_error():
+    """Test that a failing run still flushes gap writes and closes the MCP session."""
+    from unittest.mock import patch, AsyncMock, MagicMock
+    import main
+
+    with patch("main.setup_structured_logging", return_value=MagicMock()), \
+         patch("main.setup_indexes", new_callable=AsyncMock, side_effect=RuntimeError("index build failed")), \
+         patch("agents.gap_resolver.flush_gap_writes", new_callable=AsyncMock) as flush, \
+         patch("agents._mcp.close_mcp_session", new_callable=AsyncMock) as close:
+        with pytest.raises(RuntimeError):
+            await main.main()
+
+    flush.assert_awaited_once()
+    close.assert_awaited_once()
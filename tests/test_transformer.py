@@ -1,56 +1,75 @@
 # tests/test_transformer.py
+import asyncio
+from collections import namedtuple
 import pytest
 from unittest.mock import patch, AsyncMock, MagicMock
 from agents.transformer import transform_data, build_transform_index
+from agents._rag import _doc_id
 from config import PipelineStep
 
+_Doc = namedtuple("_Doc", ["page_content"])  # Retrieved docs only need .page_content
+
 
 @pytest.mark.asyncio
-async def test_transform_data():
+async def test_transform_data(transformer_io):
     """Test transform_data function with proper mocking"""
     mock_step = PipelineStep(step_name="clean", code_snippet="", rationale="")
     
-    # Mock the retriever invoke method
-    mock_doc = MagicMock()
-    mock_doc.page_content = "Scale numerics"
+    transformer_io.retriever.ainvoke.return_value = [_Doc("Scale numerics")]
+    transformer_io.call_tool.return_value = MagicMock(
+        structuredContent={
+            "transformed_json": "[]",
+            "metadata": {"size_mb": 0.5, "debug_blob": "x" * 1000},
+        }
+    )
+    transformer_io.chain.ainvoke = AsyncMock(return_value=PipelineStep(
+        step_name="transform",
+        code_snippet="scaler.fit_transform()",
+        rationale="Applied transformations with single-pass processing",
+    ))
     
-    with patch("agents.transformer.retriever") as mock_retriever:
-        mock_retriever.invoke.return_value = [mock_doc]
-        
-        # Mock MCP client
-        with patch("agents.transformer.streamablehttp_client") as mock_client_ctx:
-            with patch("agents.transformer.ClientSession") as mock_session_cls:
-                mock_session = AsyncMock()
-                mock_session.initialize = AsyncMock()
-                mock_session.call_tool.return_value = AsyncMock(
-                    structuredContent={
-                        "transformed_json": "[]",
-                        "metadata": {"size_mb": 0.5},
-                    }
-                )
-                mock_session_cls.return_value.__aenter__.return_value = mock_session
-                mock_client_ctx.return_value.__aenter__.return_value = (None, None, None)
-                
-                # Mock the chain - make ainvoke an async function
-                with patch("agents.transformer.chain") as mock_chain:
-                    mock_chain.ainvoke = AsyncMock(return_value=PipelineStep(
-                        step_name="transform",
-                        code_snippet="scaler.fit_transform()",
-                        rationale="Applied transformations with single-pass processing",
-                    ))
-                    
-                    result = await transform_data("data/test.csv", mock_step)
-                    assert isinstance(result, PipelineStep)
-                    assert result.step_name == "transform"
-                    assert "scaler.fit_transform()" in result.code_snippet
-
-
-def test_build_transform_index():
+    result = await transform_data("data/test.csv", mock_step)
+    assert isinstance(result, PipelineStep)
+    assert result.step_name == "transform"
+    assert "scaler.fit_transform()" in result.code_snippet
+    # Only whitelisted metadata reaches the prompt
+    assert transformer_io.chain.ainvoke.call_args.args[0]["clean_metadata"] == '{"size_mb":0.5}'
+
+
+@pytest.mark.asyncio
+async def test_transform_data_overlaps_retrieval_and_mcp(transformer_io):
+    """Test that RAG retrieval and the MCP call are in flight at the same time"""
+    mock_step = PipelineStep(step_name="clean", code_snippet="", rationale="")
+    mcp_started = asyncio.Event()
+
+    async def retrieve(query):
+        # Only completes if the MCP call was started before retrieval finished
+        await asyncio.wait_for(mcp_started.wait(), timeout=1)
+        return []
+
+    async def call_tool(name, arguments):
+        mcp_started.set()
+        return MagicMock(structuredContent={"metadata": {}})
+
+    transformer_io.retriever.ainvoke = retrieve
+    transformer_io.call_tool.side_effect = call_tool
+    transformer_io.chain.ainvoke = AsyncMock(return_value=PipelineStep(step_name="t", code_snippet="", rationale=""))
+
+    result = await transform_data("data/test.csv", mock_step)
+
+    assert result.step_name == "t"
+
+
+def test_build_transform_index(tmp_path):
     """Test build_transform_index function - no persist() method in new Chroma"""
-    with patch("agents.transformer.vectorstore") as mock_vectorstore:
+    with patch("agents.transformer._vectorstore") as get_vectorstore, \
+         patch("agents.transformer.INDEX_DIR", tmp_path):  # Keep build sentinels out of indexes/
+        mock_vectorstore = get_vectorstore.return_value
         mock_vectorstore.add_texts = MagicMock()
+        mock_vectorstore.get_by_ids.return_value = [MagicMock(id=_doc_id("Known rule"))]
         
-        build_transform_index(["Test rule"])
+        build_transform_index(["Known rule", "Test rule"])
         
-        # Only test add_texts since persist() doesn't exist in new Chroma version
-        mock_vectorstore.add_texts.assert_called_once_with(["Test rule"])
+        # Only test add_texts since persist() doesn't exist in new Chroma version;
+        # docs already in the collection (by content-hash id) are not re-embedded
+        mock_vectorstore.add_texts.assert_called_once_with(["Test rule"], ids=[_doc_id("Test rule")])
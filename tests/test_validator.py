@@ -0,0 +1,92 @@
+# tests/test_validator.py
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from agents.validator import VOTE_MODEL_KEYS, get_chain, validate_steps, vote_cache
+from config import PipelineStep
+
+@pytest.fixture(autouse=True)
+def _fresh_vote_cache():
+    vote_cache.clear()  # Votes from one test must not satisfy the next
+    yield
+    vote_cache.clear()
+
+
+STEPS = [PipelineStep(step_name="ingest", code_snippet="pd.read_csv(path)", rationale="load")]
+
+
+def _vote(rationale: str) -> MagicMock:
+    chain = MagicMock()
+    chain.ainvoke = AsyncMock(return_value=PipelineStep(step_name="vote", code_snippet="", rationale=rationale))
+    return chain
+
+
+@pytest.mark.asyncio
+async def test_validate_steps_uses_prebuilt_vote_chains():
+    """Test that each model votes through its prebuilt chain with the steps dumped once"""
+    chains = {key: _vote("Yes, valid") for key in VOTE_MODEL_KEYS}
+    mcp_result = MagicMock(structuredContent={"valid": True, "issues": []})
+    with patch("agents.validator.get_chain", side_effect=chains.get), \
+         patch("agents.validator.call_mcp_tool", new_callable=AsyncMock, return_value=mcp_result) as mock_mcp:
+        step, votes = await validate_steps(STEPS, "ctx")
+
+    assert [v["vote"] for v in votes] == ["Yes"] * 3
+    assert step.code_snippet == ""
+    dumped = mock_mcp.call_args.args[1]["steps"]
+    for chain in chains.values():
+        assert chain.ainvoke.call_args.args[0]["pipeline_steps"] is dumped
+
+
+@pytest.mark.asyncio
+async def test_vote_matches_whole_word_yes():
+    """Test that only a standalone "yes" counts as a yes vote"""
+    rationales = iter(["YES - scalable", "Checked yesterday's run: invalid", "eyes on nulls; no"])
+    chains = {key: _vote(next(rationales)) for key in VOTE_MODEL_KEYS}
+    mcp_result = MagicMock(structuredContent={"valid": False, "issues": []})
+    with patch("agents.validator.get_chain", side_effect=chains.get), \
+         patch("agents.validator.call_mcp_tool", new_callable=AsyncMock, return_value=mcp_result):
+        step, votes = await validate_steps(STEPS, "ctx")
+
+    assert [v["vote"] for v in votes] == ["Yes", "No", "No"]
+    assert step.code_snippet == "Refine pipeline"
+
+
+@pytest.mark.asyncio
+async def test_only_configured_models_vote():
+    """Test that roles without a model (no chain) are left out of the debate"""
+    chains = {"validator": _vote("yes"), "cleaner": _vote("no")}
+    mcp_result = MagicMock(structuredContent={"valid": True, "issues": []})
+    with patch("agents.validator.get_chain", side_effect=chains.get), \
+         patch("agents.validator.call_mcp_tool", new_callable=AsyncMock, return_value=mcp_result):
+        _, votes = await validate_steps(STEPS, "ctx")
+
+    assert len(votes) == 2
+    for chain in chains.values():
+        chain.ainvoke.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_vote_cache_misses_when_step_code_changes():
+    """Test that a revised step with the same name re-votes; an identical resubmission reuses the vote"""
+    chain = _vote("yes")
+    mcp_result = MagicMock(structuredContent={"valid": True, "issues": []})
+    revised = [STEPS[0].model_copy(update={"code_snippet": "pd.read_csv(path, dtype_backend='pyarrow')"})]
+    with patch("agents.validator.get_chain", side_effect={"validator": chain}.get), \
+         patch("agents.validator.call_mcp_tool", new_callable=AsyncMock, return_value=mcp_result):
+        await validate_steps(STEPS, "ctx")
+        await validate_steps(STEPS, "ctx")
+        assert chain.ainvoke.await_count == 1  # Exact repeat: cached
+        await validate_steps(revised, "ctx")
+
+    assert chain.ainvoke.await_count == 2
+
+
+def test_get_chain_is_built_once_per_role():
+    """Test that vote chains are memoized and unavailable models yield no chain"""
+    get_chain.cache_clear()
+    try:
+        with patch("agents.validator.MODELS", {"validator": FakeListChatModel(responses=["{}"]), "cleaner": None}):
+            assert get_chain("validator") is get_chain("validator")
+            assert get_chain("cleaner") is None
+    finally:
+        get_chain.cache_clear()
@@ -1,34 +1,111 @@
 # tools/data_tools.py
+import io
 import os
 import asyncio
-from typing import Any, List
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List
 from pydantic import BaseModel, Field
+from pydantic_core import from_json, to_json
 from mcp.server.fastmcp import FastMCP, Context
+import numpy as np
 import pandas as pd
 
 
 mcp = FastMCP("DataEngTools", stateless_http=True)  # Stateless for scalability
+# Tool results are built with model_construct: every field is produced here, so per-call
+# validation is pure overhead (tool *inputs* are still validated by FastMCP)
+
+CSV_CHUNK_ROWS = 100_000  # Rows per chunk when a tool streams a CSV instead of loading it
+PARALLEL_MIN_ROWS = 50_000  # Below this, per-column thread fan-out costs more than it saves
+
+
+def _map_columns(fn: Callable[[Any], Any], columns: Iterable[Any], rows: int) -> List[Any]:
+    """fn over each column, in order; threaded for large frames (NumPy/pandas kernels release the GIL)."""
+    columns = list(columns)
+    if rows < PARALLEL_MIN_ROWS or len(columns) < 2:
+        return [fn(column) for column in columns]
+    return list(_column_pool().map(fn, columns))
+
+
+@functools.cache
+def _column_pool() -> ThreadPoolExecutor:
+    """One worker pool for the server's lifetime: tool calls don't pay thread start-up."""
+    return ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="data-tools")
+
+
+def _column_kinds(df: pd.DataFrame) -> tuple[List[Any], List[Any]]:
+    """(numeric, categorical) column names from one walk over the dtypes.
+
+    Numeric matches select_dtypes("number") (bools excluded); categorical is object or category.
+    """
+    numeric_cols, cat_cols = [], []
+    for col, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) or dtype == object:
+            cat_cols.append(col)
+        elif pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            numeric_cols.append(col)
+    return numeric_cols, cat_cols
+
+
+def read_frame(file_path: str, **kwargs: Any) -> pd.DataFrame:
+    """Read a dataset by extension: Parquet (columnar, multithreaded) or CSV."""
+    if file_path.endswith(".parquet"):
+        return pd.read_parquet(file_path, **kwargs)
+    return pd.read_csv(file_path, **kwargs)
+
+
+# Inter-tool DataFrame payload: columnar JSON (orient="split": column names once, then
+# row value arrays) instead of one {column: value} object per row. Encoded/decoded by
+# pydantic_core's Rust JSON (~3x pandas' to_json); missing values are null, datetimes ISO 8601
+def frame_to_json(df: pd.DataFrame) -> str:
+    rows = df.astype(object).where(df.notna(), None).to_numpy().tolist()  # Python scalars
+    return to_json({"columns": df.columns.tolist(), "data": rows}, fallback=str).decode()
+
+
+def frame_from_json(payload: str) -> pd.DataFrame:
+    if not payload:
+        return pd.DataFrame()
+    # Row-records payloads from older callers are still accepted
+    if payload.lstrip().startswith("["):
+        return pd.read_json(io.StringIO(payload), orient="records")
+    split = from_json(payload)
+    return pd.DataFrame(split["data"], columns=split["columns"])
 
 
 class CsvLoadResult(BaseModel):
     """Structured output for CSV loading."""
 
-    data_json: str = Field(description="JSON-serialized DataFrame")
+    data_json: str = Field(description="Columnar JSON DataFrame (orient=split)")
     metadata: dict[str, Any] = Field(
         description="Data stats: rows, cols, size_mb, sharding_hint"
     )
 
 
 @mcp.tool()
-def load_csv(file_path: str, ctx: Context) -> CsvLoadResult:
-    """MCP tool: Load and serialize CSV with sharding hints."""
-    df = pd.read_csv(file_path)
+def load_csv(file_path: str, ctx: Context, include_data: bool = True) -> CsvLoadResult:
+    """MCP tool: Load and serialize CSV (or .parquet) with sharding hints.
+
+    include_data=False returns metadata only (data_json is empty): for CSV it parses just
+    the header and streams the first column in chunks instead of loading the whole file.
+    """
+    if include_data or file_path.endswith(".parquet"):  # Parquet has no text scan to skip
+        df = read_frame(file_path)
+        rows, columns = len(df), len(df.columns)
+        data_json = frame_to_json(df) if include_data else ""
+    else:
+        columns = len(pd.read_csv(file_path, nrows=0).columns)
+        # Count rows chunk by chunk: resident memory stays bounded for >RAM files
+        rows = sum(
+            len(chunk) for chunk in pd.read_csv(file_path, usecols=[0], chunksize=CSV_CHUNK_ROWS)
+        ) if columns else 0
+        data_json = ""
     file_size = os.path.getsize(file_path) / (1024 * 1024)  # MB
-    metadata = {"rows": len(df), "columns": len(df.columns), "size_mb": file_size}
+    metadata = {"rows": rows, "columns": columns, "size_mb": file_size}
     if file_size > 10:
         metadata["sharding_hint"] = "Chunk into 10k rows for parallel ETL."
         # Remove async call for now - will work in sync context
-    return CsvLoadResult(data_json=df.to_json(orient="records"), metadata=metadata)
+    return CsvLoadResult.model_construct(data_json=data_json, metadata=metadata)
 
 
 class DataValidationResult(BaseModel):
@@ -36,67 +113,99 @@ class DataValidationResult(BaseModel):
     issues: List[str] = Field(description="List of validation issues")
 
 
+def _frame_issues(df: pd.DataFrame) -> List[str]:
+    """Data checks, each one vectorized pass over the frame (no row iteration)."""
+    if df.empty:
+        return ["Dataset has no rows"]
+    null_counts = df.isna().sum()
+    issues = [f"Column '{col}' has {n} null values" for col, n in null_counts[null_counts > 0].items()]
+    duplicates = int(df.duplicated().sum())  # Hashed rows, not pairwise comparison
+    if duplicates:
+        issues.append(f"Dataset has {duplicates} duplicate rows")
+    return issues
+
+
 @mcp.tool()
-def validate_data(steps: List[dict], ctx: Context) -> DataValidationResult:
-    """MCP tool: Validate pipeline steps (e.g., schema checks)."""
-    # Simulated validation; in prod, use libraries like Great Expectations
-    issues = []  # E.g., check for nulls, types
+def validate_data(steps: List[dict], ctx: Context, data_json: str = "") -> DataValidationResult:
+    """MCP tool: Validate pipeline steps (e.g., schema checks).
+
+    data_json (a tool payload, e.g. cleaned_json) adds null/duplicate checks on the data itself.
+    """
+    # Simulated step validation; in prod, use libraries like Great Expectations
+    issues = []
     if not steps:
         issues.append("No steps provided")
-    return DataValidationResult(valid=len(issues) == 0, issues=issues)
+    if data_json:
+        issues.extend(_frame_issues(frame_from_json(data_json)))
+    return DataValidationResult.model_construct(valid=len(issues) == 0, issues=issues)
 
 
 class CleanDataResult(BaseModel):
     """Structured output for data cleaning."""
 
-    cleaned_json: str = Field(description="JSON-serialized cleaned DataFrame")
+    cleaned_json: str = Field(description="Columnar JSON cleaned DataFrame (orient=split)")
     metadata: dict = Field(
         description="Cleaning stats: nulls_fixed, outliers_removed, size_mb"
     )
 
 
+def _outlier_mask(values: np.ndarray, mean, std, out: np.ndarray) -> np.ndarray:
+    """Flag cells more than 3 std from their column mean into `out`. Works in place on
+    `values` (a scratch copy), so nothing new is allocated."""
+    np.subtract(values, mean, out=values)
+    np.abs(values, out=values)
+    return np.greater(values, 3 * std, out=out)
+
+
 @mcp.tool()
 def clean_data(file_path: str, ingest_metadata: dict, ctx: Context) -> CleanDataResult:
-    """MCP tool: Clean CSV (nulls, outliers)."""
-    df = pd.read_csv(file_path)
+    """MCP tool: Clean CSV (nulls, outliers).
+
+    Callers already holding a load_csv(include_data=True) payload can pass its data_json in
+    ingest_metadata to skip the re-read (opt-in). The pipeline's cleaner sends the ingest
+    PipelineStep, which has no data_json, so it reads file_path.
+    """
+    data_json = ingest_metadata.get("data_json")
+    df = frame_from_json(data_json) if data_json else read_frame(file_path)
     file_size = os.path.getsize(file_path) / (1024 * 1024)  # MB
     metadata = {"size_mb": file_size, "nulls_fixed": 0, "outliers_removed": 0}
 
     # Basic cleaning (extend with Great Expectations for prod)
     metadata["nulls_fixed"] = int(df.isna().sum().sum())  # Convert numpy int to Python int
-    df = df.fillna(df.median(numeric_only=True))  # Simple imputation
-    # Outlier detection (example): Remove >3 std dev
-    numeric_cols = df.select_dtypes(include="number").columns
-    outliers = (
-        (
-            (df[numeric_cols] - df[numeric_cols].mean()).abs()
-            > 3 * df[numeric_cols].std()
-        )
-        .sum()
-        .sum()
-    )
-    metadata["outliers_removed"] = int(outliers)  # Convert numpy int to Python int
-    df = df[
-        ~(
-            (df[numeric_cols] - df[numeric_cols].mean()).abs()
-            > 3 * df[numeric_cols].std()
-        ).any(axis=1)
-    ]
+    # Numeric block selected once and reused for imputation and outlier stats
+    numeric_cols, _ = _column_kinds(df)
+    numeric = df[numeric_cols].fillna(df[numeric_cols].median())  # Simple imputation
+    df[numeric_cols] = numeric
+    # Outlier detection (example): Remove >3 std dev. Stats are NumPy reductions over one
+    # float64 block; one boolean mask (no label alignment) serves the count and the filter
+    values = np.array(numeric.to_numpy(dtype=np.float64), order="F")  # Scratch copy; contiguous columns
+    if len(values) > 1:
+        mean, std = values.mean(axis=0), values.std(axis=0, ddof=1)  # ddof=1 as pandas .std()
+        outlier_mask = np.empty(values.shape, dtype=bool, order="F")
+
+        def mask_column(j: int) -> None:
+            _outlier_mask(values[:, j], mean[j], std[j], out=outlier_mask[:, j])
+
+        _map_columns(mask_column, range(values.shape[1]), len(values))
+    else:
+        outlier_mask = np.zeros(values.shape, dtype=bool)  # Sample std undefined: nothing to flag
+    metadata["outliers_removed"] = int(outlier_mask.sum())  # Convert numpy int to Python int
+    df = df[~outlier_mask.any(axis=1)]
 
     if file_size > 10:
         metadata["sharding_hint"] = "Chunk into 10k rows for parallel cleaning."
         # Remove async call for now - will work in sync context
 
-    return CleanDataResult(cleaned_json=df.to_json(orient="records"), metadata=metadata)
-
-
-from sklearn.preprocessing import StandardScaler, OneHotEncoder  # For transforms
+    return CleanDataResult.model_construct(cleaned_json=frame_to_json(df), metadata=metadata)
 
 
 class TransformDataResult(BaseModel):
     """Structured output for data transformation."""
 
-    transformed_json: str = Field(description="JSON-serialized transformed DataFrame")
+    transformed_json: str = Field(
+        description="Columnar JSON transformed DataFrame (orient=split): z-scored numerics and "
+        "<col>_<value> one-hot indicators, both float32 (indicators sparse in memory)"
+    )
     metadata: dict = Field(
         description="Transform stats: new_features, scaled_cols, size_mb"
     )
@@ -107,26 +216,34 @@ def transform_data(
     file_path: str, clean_metadata: dict, ctx: Context
 ) -> TransformDataResult:
     """MCP tool: Transform data (scaling, encoding, derivations)."""
-    df = pd.read_json(
-        clean_metadata.get("cleaned_json", "[]"), orient="records"
-    )  # From clean step
+    df = frame_from_json(clean_metadata.get("cleaned_json", ""))  # From clean step
     file_size = clean_metadata.get("size_mb", 0)
     metadata = {"size_mb": file_size, "new_features": 0, "scaled_cols": 0}
 
     # Basic transforms (extend with Featuretools for auto-eng in prod)
-    # Scaling numerics
-    numeric_cols = df.select_dtypes(include="number").columns
-    if len(numeric_cols) > 0:
-        scaler = StandardScaler()
-        df[numeric_cols] = scaler.fit_transform(df[numeric_cols])
+    numeric_cols, cat_cols = _column_kinds(df)  # Both kinds from one dtype walk, up front
+    # Scaling numerics: z-score on the raw float block (as StandardScaler: population std,
+    # NaN-aware stats, constant columns left unscaled)
+    # Stats in float64; the scaled output is stored as float32 (half the bytes downstream)
+    if len(numeric_cols) > 0 and len(df) > 0:
+        values = df[numeric_cols].to_numpy(dtype=np.float64)
+        std = np.nanstd(values, axis=0)
+        std[std == 0] = 1.0
+        df[numeric_cols] = ((values - np.nanmean(values, axis=0)) / std).astype(np.float32)
         metadata["scaled_cols"] = len(numeric_cols)
 
-    # Encoding categoricals
-    cat_cols = df.select_dtypes(include="object").columns
+    # Encoding categoricals: <col>_<value> indicator columns (OneHotEncoder's naming).
+    # Low-cardinality strings become category codes first; indicators are sparse float32
+    # (only the 1s are stored, so high-cardinality columns don't allocate a dense n x k block)
     if len(cat_cols) > 0:
-        encoder = OneHotEncoder(sparse_output=False, handle_unknown="ignore")
-        encoded = pd.DataFrame(
-            encoder.fit_transform(df[cat_cols]), columns=encoder.get_feature_names_out()
+        df[cat_cols] = df[cat_cols].astype("category")
+        encoded = pd.concat(
+            _map_columns(
+                lambda col: pd.get_dummies(df[col], prefix=col, dtype=np.float32, sparse=True),
+                cat_cols,
+                len(df),
+            ),
+            axis=1,
         )
         df = pd.concat([df.drop(cat_cols, axis=1), encoded], axis=1)
         metadata["new_features"] += encoded.shape[1] - len(cat_cols)
@@ -140,9 +257,7 @@ def transform_data(
         metadata["sharding_hint"] = "Parallel transform per feature group."
         # Remove async call for now - will work in sync context
 
-    return TransformDataResult(
-        transformed_json=df.to_json(orient="records"), metadata=metadata
-    )
+    return TransformDataResult.model_construct(transformed_json=frame_to_json(df), metadata=metadata)
 
 
 def main():
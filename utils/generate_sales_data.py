@@ -1,12 +1,10 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-import random
-import uuid
+from datetime import datetime
 import os
 import logging
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, Any
 
 # Configure logging
 logging.basicConfig(
@@ -24,7 +22,6 @@ OUTPUT_PATH = OUTPUT_DIR / "sales_data.csv"
 
 # Seed for reproducibility
 np.random.seed(42)
-random.seed(42)
 
 # Configuration dictionary for scalability
 CONFIG = {
@@ -46,56 +43,67 @@ CONFIG = {
     ],
     "regions": ["North America", "Europe", "Asia", "South America", "Africa"],
     "chunk_size": 10000,  # For large datasets, write in chunks
+    # "parquet" writes a zstd Parquet file next to the CSV path (pyarrow engine);
+    # CSV stays the default for existing consumers
+    "output_format": os.getenv("SALES_DATA_FORMAT", "csv"),
 }
 
 
-def generate_date_range(start_date: datetime, end_date: datetime) -> List[datetime]:
-    """Generate a list of dates between start_date and end_date."""
-    return [start_date + timedelta(days=x) for x in range((end_date - start_date).days)]
+# Hex-digit positions within the 36-char canonical UUID string (dashes at 8, 13, 18, 23)
+_UUID_HEX_POSITIONS = [i for i in range(36) if i not in (8, 13, 18, 23)]
+
+
+def generate_uuid4_strings(n: int) -> np.ndarray:
+    """n random RFC 4122 version-4 UUID strings from one os.urandom call (no per-row uuid4())."""
+    raw = np.frombuffer(os.urandom(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # Version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    hex_digits = np.frombuffer(raw.tobytes().hex().encode("ascii"), dtype=np.uint8).reshape(n, 32)
+    chars = np.full((n, 36), ord("-"), dtype=np.uint8)
+    chars[:, _UUID_HEX_POSITIONS] = hex_digits
+    return chars.view("S36").ravel().astype(str)
 
 
 def generate_sales_data(config: Dict[str, Any]) -> pd.DataFrame:
     """Generate a DataFrame with synthetic sales data."""
     try:
         num_records = config["num_records"]
-        date_range = generate_date_range(config["start_date"], config["end_date"])
-
-        data = {
-            "order_id": [str(uuid.uuid4()) for _ in range(num_records)],
-            "order_date": [
-                random.choice(date_range).strftime("%Y-%m-%d")
-                for _ in range(num_records)
-            ],
-            "product": [],
-            "category": [],
-            "quantity": [random.randint(1, 10) for _ in range(num_records)],
-            "unit_price": [],
-            "total_price": [],
-            "customer_region": [
-                random.choice(config["regions"]) for _ in range(num_records)
-            ],
-        }
-
-        for i in range(num_records):
-            product = random.choice(config["products"])
-            data["product"].append(product["name"])
-            data["category"].append(product["category"])
-            price_variation = product["base_price"] * random.uniform(0.9, 1.1)
-            data["unit_price"].append(round(price_variation, 2))
-            data["total_price"].append(
-                round(data["unit_price"][-1] * data["quantity"][i], 2)
-            )
-
-        df = pd.DataFrame(data).astype(
+        num_days = (config["end_date"] - config["start_date"]).days
+
+        # Vectorized draws: one NumPy call per column instead of a Python loop per row
+        products = config["products"]
+        product_idx = np.random.randint(0, len(products), num_records)
+        quantity = np.random.randint(1, 11, num_records)
+        base_price = np.array([p["base_price"] for p in products])[product_idx]
+        unit_price = np.round(base_price * np.random.uniform(0.9, 1.1, num_records), 2)
+        # Dates: format each of the num_days calendar days once, then gather by day offset
+        date_table = pd.date_range(config["start_date"], periods=num_days, freq="D").strftime("%Y-%m-%d")
+        order_dates = date_table.to_numpy()[np.random.randint(0, num_days, num_records)]
+
+        df = pd.DataFrame(
+            {
+                "order_id": generate_uuid4_strings(num_records),
+                "order_date": order_dates,
+                "product": np.array([p["name"] for p in products])[product_idx],
+                "category": np.array([p["category"] for p in products])[product_idx],
+                "quantity": quantity,
+                "unit_price": unit_price,
+                "total_price": np.round(unit_price * quantity, 2),
+                "customer_region": np.array(config["regions"])[
+                    np.random.randint(0, len(config["regions"]), num_records)
+                ],
+            }
+        ).astype(
             {
                 "order_id": str,
                 "order_date": str,
-                "product": str,
-                "category": str,
-                "quantity": int,
-                "unit_price": float,
-                "total_price": float,
-                "customer_region": str,
+                # Narrow numerics + category codes for the low-cardinality strings
+                "product": "category",
+                "category": "category",
+                "quantity": "int32",
+                "unit_price": "float32",
+                "total_price": "float32",
+                "customer_region": "category",
             }
         )
 
@@ -123,12 +131,27 @@ def save_to_csv(df: pd.DataFrame, output_path: Path, chunk_size: int) -> None:
         raise
 
 
+def save_to_parquet(df: pd.DataFrame, output_path: Path) -> None:
+    """Save DataFrame to Parquet (columnar, zstd; category columns stay dictionary-encoded)."""
+    try:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(output_path, index=False, compression="zstd")
+        logger.info(f"Sales data saved to {output_path}")
+
+    except Exception as e:
+        logger.error(f"Error saving Parquet: {str(e)}")
+        raise
+
+
 def main() -> None:
     """Main function to generate and save sales data."""
     try:
         sales_df = generate_sales_data(CONFIG)
-        save_to_csv(sales_df, OUTPUT_PATH, CONFIG["chunk_size"])
-        logger.info(f"Generated CSV with columns: {list(sales_df.columns)}")
+        if CONFIG["output_format"] == "parquet":
+            save_to_parquet(sales_df, OUTPUT_PATH.with_suffix(".parquet"))
+        else:
+            save_to_csv(sales_df, OUTPUT_PATH, CONFIG["chunk_size"])
+        logger.info(f"Generated {CONFIG['output_format']} with columns: {list(sales_df.columns)}")
 
     except Exception as e:
         logger.error(f"Script execution failed: {str(e)}")